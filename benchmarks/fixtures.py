@@ -0,0 +1,128 @@
+import os
+
+# Synthetic listing pages shaped like the real Capterra, GetApp, SHI and G2 markup:
+# the product cards and pagination the scrapers select on, wrapped in enough
+# unrelated markup (nav, footer, inline script) that parse cost is in the same
+# range as a real page. Pass a directory of recorded pages to use those instead.
+
+PRODUCTS_PER_PAGE = {
+    'capterra': 25,
+    'getapp': 25,
+    'shi': 20,
+    'g2': 20,
+}
+
+
+def _filler(kb=250):
+    links = ''.join(
+        f'<li class="nav-item"><a href="/nav/{i}/" data-track="nav-{i}">Navigation link {i}</a></li>'
+        for i in range(kb * 4)
+    )
+    blob = '{"state": [' + ','.join(f'{{"id": {i}, "v": "{"x" * 40}"}}' for i in range(kb * 4)) + ']}'
+    return f'<nav><ul>{links}</ul></nav>', f'<script type="application/json">{blob}</script>'
+
+
+_NAV, _SCRIPT = _filler()
+
+
+def _page(body):
+    return (f'<!DOCTYPE html><html><head><title>Fixture</title>{_SCRIPT}</head>'
+            f'<body>{_NAV}<main>{body}</main><footer>{_NAV}</footer></body></html>')
+
+
+def capterra_page(page, n_pages):
+    cards = ''.join(
+        f'<div id="product-card-container-{page}-{i}" class="card">'
+        f'<a href="/p/{page}{i}/Product-{page}-{i}/"><img alt="logo"></a>'
+        f'<h2>Product {page}-{i}</h2>'
+        f'<p>Capterra product {page}-{i} helps teams do things. Learn More about it</p></div>'
+        for i in range(PRODUCTS_PER_PAGE['capterra'])
+    )
+    pagination = f'<div data-test-id="current-page-display"><span>{page}</span> of <span>{n_pages}</span></div>'
+    return _page(cards + pagination)
+
+
+def getapp_page(page, n_pages):
+    cards = ''.join(
+        f'<div data-evt-name="product_card" data-evt-id="card-{page}-{i}">'
+        f'<div data-testid="product-header"><a href="/software/app-{page}-{i}/"><h2>App {page}-{i}</h2></a>'
+        f'<span role="button" data-evt-id="compare-{page}-{i}">Compare</span></div>'
+        f'<div data-testid="product-description">GetApp product {page}-{i} description.</div></div>'
+        for i in range(PRODUCTS_PER_PAGE['getapp'])
+    )
+    pagination = f'<div class="Pagination_wrapper"><p>Page {page} of {n_pages}</p></div>'
+    return _page(cards + pagination)
+
+
+def _shi_product(page, i):
+    return (f'<div class="row srProduct"><div data-prodid="{page}{i}" data-prodname="SHI Product {page}-{i}" data-price="{i}.99">'
+            f'<div><a href="/product/{page}{i}/shi-product">SHI Product {page}-{i}</a>'
+            f'<ul><li>Subscription</li><li>1 year</li><li>Per user</li></ul></div></div>'
+            f'<div class="partNumWrapper"><small class="srh_pr.mfrn"><strong>Mfr. #</strong> MFR-{page}-{i}</small>'
+            f'<small class="srh_pr.shin"><strong>SHI #</strong> {page}{i:04d}</small></div></div>')
+
+
+def shi_page(page, n_pages, offset=None, size=20):
+    """SHI results offset..offset+size of a category with n_pages pages of 20.
+
+    Products keep the same identity at any page size, so a crawl at 100 per page
+    has to produce exactly the rows of one at 20.
+    """
+    per_page = PRODUCTS_PER_PAGE['shi']
+    total = n_pages * per_page
+    offset = per_page * (page - 1) if offset is None else offset
+    end = min(offset + size, total)
+    products = ''.join(_shi_product(k // per_page + 1, k % per_page) for k in range(offset, end))
+    count = f'<div class="srResultsCount">{offset + 1} - {end} of {total} results</div>'
+    links = ''.join(f'<a href="?p={start}, {size}">{n}</a>' for n, start in enumerate(range(0, total, size), start=1))
+    pagination = f'<div class="searchPages">{links}</div>' if total > size else ''
+    return _page(f'{count}<div id="srResultsDiv">{products}</div>{pagination}')
+
+
+def g2_page(page, n_pages):
+    products = ''.join(
+        f'<div data-ordered-events-item="product-{page}-{i}"><div class="product-name">G2 Product {page}-{i}</div>'
+        f'<a href="https://www.g2.com/products/g2-product-{page}-{i}/reviews">Reviews</a>'
+        f'<p>G2 product {page}-{i} description...Show More</p></div>'
+        for i in range(PRODUCTS_PER_PAGE['g2'])
+    )
+    items = ''.join(f'<li><a href="?order=g2_score&page={n}">{n}</a></li>' for n in range(1, n_pages + 1))
+    pagination = f'<ul aria-label="Pagination">{items}</ul>' if n_pages > 1 else ''
+    return _page(products + pagination)
+
+
+def g2_categories_page(n_tables=40, rows_per_table=40):
+    tables = []
+    for t in range(n_tables):
+        top = f"Top {t}"
+        rows = []
+        for r in range(rows_per_table):
+            # Every fifth row starts a new level-2 branch; the rest hang under it
+            parent = top if r % 5 == 0 else f"Cat {t}-{r - r % 5}"
+            rows.append(
+                f'<tr><td><div class="categories__name"><a href="/categories/cat-{t}-{r}">Cat {t}-{r}</a></div>'
+                f'<div class="categories__parent">{parent}</div></td></tr>'
+            )
+        tables.append(f'<table><thead><tr><td class="l3">{top}</td></tr></thead><tbody>{"".join(rows)}</tbody></table>')
+    return _page(''.join(tables))
+
+
+PAGE_BUILDERS = {
+    'capterra': capterra_page,
+    'getapp': getapp_page,
+    'shi': shi_page,
+    'g2': g2_page,
+}
+
+
+def listing_page(site, page=1, n_pages=5, fixtures_dir=None, **options):
+    """A listing page for site; a recorded <fixtures_dir>/<site>.html wins if present.
+
+    options go to the site's page builder, e.g. offset and size for SHI.
+    """
+    if fixtures_dir:
+        path = os.path.join(fixtures_dir, f"{site}.html")
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+    return PAGE_BUILDERS[site](page, n_pages, **options)
@@ -0,0 +1,197 @@
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+# The scrapers read these at import time; the benchmark never uses a real proxy
+for name in ('PROXY_USER', 'PROXY_PASSWORD', 'PROXY_HOST', 'PROXY_PORT'):
+    os.environ.setdefault(name, 'bench')
+# Every page has to come from the fixture server, never from an earlier run's cache
+os.environ['PAGE_CACHE'] = '0'
+# The fixture server needs no throttling, and real crawls' limiter state must stay untouched
+os.environ['RATE_LIMIT'] = '0'
+os.environ.setdefault('STAGE_TRACE', '0')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import PRODUCTS_PER_PAGE, g2_categories_page, listing_page
+from benchmarks.server import FixtureServer
+from utils.browser_pool import BrowserPool
+from utils.parsing import HTMLParser, parse_page
+
+SITES = ['capterra', 'getapp', 'shi', 'g2']
+
+
+def load_site(site):
+    """Imports a site's scraper module lazily; returns (module, extract(soup) -> records)."""
+    if site == 'capterra':
+        import capsterra_test as module
+        row = {'category_name': 'Bench', 'cloud_link': 'bench'}
+        return module, lambda soup: module.scrape_tables(soup.select("div[id*='product-card-container']"), row)
+    if site == 'getapp':
+        import scrape_getapp as module
+        row = {'Parent Category': 'Bench', 'Category Name': 'Bench', 'Web-Based Link': 'bench'}
+        return module, lambda soup: module.scrape_tables(soup.select('div[data-evt-name*="product"]'), row, None)
+    if site == 'shi':
+        import scrape_shi as module
+        row = {'Last Category Name': 'Bench'}
+        return module, lambda soup: [module.get_product_overview(div, row)
+                                     for div in soup.select('div[id="srResultsDiv"] div.row.srProduct')]
+    from utils import g2_helper as module
+    return module, lambda soup: [module.get_product_table(div)
+                                 for div in soup.select("div[data-ordered-events-item*='product']")]
+
+
+def time_per_call(func, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        result = func()
+    return (time.perf_counter() - started) * 1000 / iterations, result
+
+
+def bench_parse(site, iterations, fixtures_dir):
+    _, extract = load_site(site)
+    html = listing_page(site, 1, 5, fixtures_dir)
+    backends = ['html.parser', 'lxml'] + (['selectolax'] if HTMLParser is not None else [])
+    expected = None
+    rows = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for backend in backends:
+            parse_ms, _ = time_per_call(lambda: parse_page(html, site, backend), iterations)
+            # get_product_overview decomposes tags, so every iteration gets its own soup
+            soups = [parse_page(html, site, backend) for _ in range(iterations)]
+            extract_ms, records = time_per_call(lambda: extract(soups.pop()), iterations)
+            if expected is None:
+                expected = records
+            rows.append((backend, parse_ms, extract_ms, len(records), records == expected))
+    print(f"\n[{site}] parse-only, {len(html) // 1024} KB page, {iterations} iterations")
+    print(f"    {'backend':<12} {'parse ms/page':>14} {'extract ms/page':>16} {'products':>9}  matches html.parser")
+    for backend, parse_ms, extract_ms, n_records, matches in rows:
+        print(f"    {backend:<12} {parse_ms:>14.2f} {extract_ms:>16.2f} {n_records:>9}  {matches}")
+    return rows
+
+
+def bench_extract_categories(iterations):
+    from utils.g2_helper import CategoryTree
+    html = g2_categories_page()
+    print(f"\n[g2] category tree, {len(html) // 1024} KB page, {iterations} iterations")
+    for backend in ('html.parser', 'lxml'):
+        soup_ms, soup = time_per_call(lambda: parse_page(html, backend=backend), iterations)
+        tables = soup.select("table")
+        extract_ms, categories = time_per_call(
+            lambda: list(CategoryTree.from_tables(tables).leaves()), iterations)
+        print(f"    {backend:<12} parse {soup_ms:.2f} ms, tree + leaves {extract_ms:.2f} ms "
+              f"({len(categories)} leaf categories)")
+
+
+def pipeline_rows(site, server, n_categories, n_pages):
+    rows = []
+    for i in range(n_categories):
+        url = server.category_url(site, i, n_pages)
+        name = f"Bench {i}"
+        if site == 'capterra':
+            rows.append({'category_name': name, 'category_link': url,
+                         'cloud_link': url + "?deployment=CLOUD_SAAS_WEB_BASED"})
+        elif site == 'getapp':
+            rows.append({'Parent Category': 'Bench', 'Category Name': name,
+                         'Category Link': url, 'Web-Based Link': url + "os/web-based"})
+        elif site == 'shi':
+            rows.append({'Category 1 Name': 'Bench', 'Category 1 Link': url,
+                         'Category 2 Name': None, 'Category 2 Link': None,
+                         'Category 3 Name': None, 'Category 3 Link': None,
+                         'Last Category Name': name, 'Last Category Link': url})
+        else:
+            rows.append({'category_1': 'Bench', 'category_2': name, 'category_3': None,
+                         'category_4': None, 'last_category_link': url})
+    return rows
+
+
+def _pipeline_worker(site, n_categories, n_pages, processes, fixtures_dir, results):
+    module, _ = load_site(site)
+    func = {
+        'capterra': lambda m: m.scrape_category,
+        'getapp': lambda m: m.scrape_category,
+        'shi': lambda m: m.scrape_app_overview_from_categories,
+        'g2': lambda m: m.scrape_categories,
+    }[site](module)
+    if site == 'shi':
+        # No proxy in front of the local server (workers are forked after this)
+        module.worker_proxy = lambda: None
+
+    with FixtureServer(fixtures_dir) as server:
+        rows = pipeline_rows(site, server, n_categories, n_pages)
+        started = time.perf_counter()
+        pool = BrowserPool(processes=processes)
+        outputs = pool.map(func, rows)
+        pool.close()
+        wall = time.perf_counter() - started
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats = pool.report()
+        requests = server.requests
+
+    n_products = sum(len(output) for output in outputs)
+    results.put({
+        'site': site,
+        'pages': n_categories * n_pages,
+        'requests': requests,
+        'products': n_products,
+        'expected_products': n_categories * n_pages * PRODUCTS_PER_PAGE[site],
+        'wall_seconds': wall,
+        'browser_starts': stats['starts'],
+        'avg_startup_seconds': stats['avg_startup_seconds'],
+        'parent_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'worker_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    })
+
+
+def bench_pipeline(site, n_categories, n_pages, processes, fixtures_dir, parse_ms):
+    # A fresh process per pipeline so peak RSS is measured per pipeline
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_pipeline_worker,
+        args=(site, n_categories, n_pages, processes, fixtures_dir, results),
+    )
+    process.start()
+    result = results.get()
+    process.join()
+    pages_per_sec = result['pages'] / result['wall_seconds'] if result['wall_seconds'] else 0.0
+    print(f"\n[{site}] pipeline, {n_categories} categories x {n_pages} pages on {processes} workers")
+    print(f"    pages/sec {pages_per_sec:.2f}, parse {parse_ms:.2f} ms/page, "
+          f"browser startup {result['avg_startup_seconds']:.2f}s x {result['browser_starts']}, "
+          f"peak RSS parent {result['parent_rss_mb']:.0f} MB / worker {result['worker_rss_mb']:.0f} MB")
+    print(f"    {result['products']}/{result['expected_products']} products, "
+          f"{result['requests']} requests served, {result['wall_seconds']:.1f}s wall")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline scraper benchmarks against fixture pages.")
+    parser.add_argument('--sites', default=','.join(SITES), help="comma-separated subset of sites")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="also run each scraper end to end in real browsers against the local server")
+    parser.add_argument('--iterations', type=int, default=20, help="parse-only iterations per backend")
+    parser.add_argument('--categories', type=int, default=8)
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--fixtures', default=None, help="directory of recorded <site>.html pages")
+    # Read by utils.warm_start from sys.argv; compare the pipeline's browser startup with and without
+    parser.add_argument('--warm-start', action='store_true',
+                        help="start the pipeline's browsers from a prepared profile and driver")
+    args = parser.parse_args(argv)
+
+    sites = [site for site in args.sites.split(',') if site]
+    for site in sites:
+        rows = bench_parse(site, args.iterations, args.fixtures)
+        parse_ms = dict((backend, ms) for backend, ms, *_ in rows)['lxml']
+        if args.pipeline:
+            bench_pipeline(site, args.categories, args.pages, args.processes, args.fixtures, parse_ms)
+    if 'g2' in sites:
+        bench_extract_categories(max(args.iterations // 4, 1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import re
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from benchmarks.fixtures import listing_page
+
+# Category paths carry their page count: /<site>/cat-<n>-<pages>/...
+CATEGORY_PATH = re.compile(r'^/(capterra|getapp|shi|g2)/cat-(\d+)-(\d+)')
+
+
+# Largest page size the fixture SHI serves; bigger requests are cut down to it
+SHI_MAX_PAGE_SIZE = 100
+
+
+def page_number(site, query):
+    params = parse_qs(unquote(query))
+    if site == 'shi':
+        return shi_window(query)[0] // 20 + 1
+    return int(params.get('page', ['1'])[0])
+
+
+def shi_window(query):
+    """(offset, size) of SHI's ?p=<offset>, <size>; size defaults to 20."""
+    offset, _, size = parse_qs(unquote(query)).get('p', ['0'])[0].partition(',')
+    return int(offset.strip() or 0), min(int(size.strip() or 20), SHI_MAX_PAGE_SIZE)
+
+
+class FixtureServer:
+    """Local stand-in for the four sites, serving fixture listing pages on 127.0.0.1."""
+
+    def __init__(self, fixtures_dir=None, port=0):
+        self.fixtures_dir = fixtures_dir
+        self.requests = 0
+        server = self
+
+        @lru_cache(maxsize=256)
+        def render(site, page, n_pages, window=None):
+            options = dict(zip(('offset', 'size'), window)) if window else {}
+            return listing_page(site, page, n_pages, server.fixtures_dir, **options).encode('utf-8')
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                match = CATEGORY_PATH.match(url.path)
+                if not match:
+                    self.send_error(404)
+                    return
+                site, n_pages = match.group(1), int(match.group(3))
+                if site == 'shi':
+                    body = render(site, 1, n_pages, shi_window(url.query))
+                else:
+                    body = render(site, min(page_number(site, url.query), n_pages), n_pages)
+                server.requests += 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def category_url(self, site, index, n_pages):
+        return f"{self.base_url}/{site}/cat-{index}-{n_pages}/"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        return False
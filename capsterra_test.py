@@ -11,6 +11,18 @@ import concurrent.futures
 import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from seleniumbase import SB
+from utils.browser_pool import borrow_browser, open_browser
+from utils.page_cache import fetch_page
+from utils.checkpoint import DELTA
+from utils.scheduler import UNCHANGED, FanOut, note_pages, should_fan_out, unchanged_since_last_run
+from utils.output_sink import EXPORT_EXCEL
+from utils.orchestrator import SiteAdapter, crawl
+from utils.page_wait import wait_for_page
+from utils.challenge import handle_challenge
+from utils.parsing import parse_page
+from utils.hybrid_fetch import HybridFetcher
+from utils.proxy_pool import worker_proxy
+from utils.stage_timing import stage, timed
 import asyncio
 import multiprocessing
 import numpy as np
@@ -57,6 +69,7 @@ def get_with_retries(scraper, url, headers, retries=2, delay=5):
                 raise  # Re-raise the last exception if all retries fail
 
 
+@timed('records')
 def scrape_tables(products_div, row):
     result_list = []
     for container in products_div:
@@ -85,43 +98,74 @@ def scrape_tables(products_div, row):
     return result_list
 
 
+def solve_captcha(sb):
+    sb.uc_gui_click_captcha()
+    sb.uc_gui_click_cf()
+
+
+def open_category_page(sb, link):
+    # sb.cdp.open(link)
+    with stage('open', 'capterra'):
+        sb.uc_open_with_reconnect(link, 5)
+    handle_challenge(sb, 'capterra', solve_captcha)
+    # sb.handle_ removed; not a valid method
+    wait_for_page(sb, 'capterra')
+
+
+def open_categories_page(sb, url):
+    sb.activate_cdp_mode(url)
+    print("Getting All Categories...")
+    sb.sleep(7)
+    sb.save_screenshot('result.png')
+
+
+SB_OPTIONS = dict(uc=True, headless=True, xvfb=True, maximize=True)
+
+
+def scrape_page(fetcher, url, row):
+    html = fetcher.get_html(url)
+    soup = parse_page(html, 'capterra')
+    product_card_containers = soup.select("div[id*='product-card-container']")
+    return scrape_tables(product_card_containers, row)
+
+
+def scrape_category_page(row, url, context=None):
+    """Fan-out task: one pagination page of a large category, on any free worker."""
+    print(f"Scraping {url}")
+    with borrow_browser(**SB_OPTIONS) as sb:
+        return scrape_page(HybridFetcher(sb, 'capterra', open_page=open_category_page), url, row)
+
+
 def scrape_category(row):
 
-    with SB(uc=True, headless=True, 
-            xvfb=True,
-            maximize=True) as sb:
+    with borrow_browser(**SB_OPTIONS) as sb:
         link = row['cloud_link']
-        # sb.cdp.open(link)
-        sb.uc_open_with_reconnect(link, 5)
-        sb.uc_gui_click_captcha()
-        sb.uc_gui_click_cf()
-        # sb.handle_ removed; not a valid method
         print(f"Scraping Category: {row['category_name']}")
-        sb.sleep(5)
-        html = sb.get_page_source()
-        soup = BeautifulSoup(html, 'html.parser')
+        html = fetch_page(sb, link, 'capterra', open_category_page, reuse=not DELTA)
+        soup = parse_page(html, 'capterra')
         try:
             page_raw = soup.select_one('div[data-test-id = "current-page-display"]').get_text(strip=True)
             match = re.search(r'of(\d+)', page_raw, re.IGNORECASE)
             last_page = int(match.group(1)) if match else 1
         except:
             last_page = 0
+        note_pages(max(last_page, 1))
 
         # Scrape first page only once
         product_card_containers = soup.select("div[id*='product-card-container']")
         result_list = scrape_tables(product_card_containers, row)
+        if unchanged_since_last_run(max(last_page, 1), result_list):
+            print(f"{row['category_name']} unchanged since the last run")
+            return UNCHANGED
 
-        # Scrape remaining pages (start from 2)
-        for i in range(2, last_page + 1):
-            url = link + f"&page={i}"
+        # Scrape remaining pages (start from 2) over HTTP with the browser's cookies
+        page_urls = [link + f"&page={i}" for i in range(2, last_page + 1)]
+        if should_fan_out(page_urls):
+            return FanOut(result_list, page_urls, scrape_category_page)
+        fetcher = HybridFetcher(sb, 'capterra', open_page=open_category_page) if page_urls else None
+        for url in page_urls:
             print(f"Scraping {url}")
-            # sb.cdp.open(url)
-            sb.uc_open(url)
-            sb.sleep(5)
-            html = sb.get_page_source()
-            soup = BeautifulSoup(html, 'html.parser')
-            product_card_containers = soup.select("div[id*='product-card-container']")
-            result_list.extend(scrape_tables(product_card_containers, row))
+            result_list.extend(scrape_page(fetcher, url, row))
 
         products_df = pd.DataFrame(result_list)
         expected_cols = ['Product Category', 'Product Category Link']
@@ -130,16 +174,11 @@ def scrape_category(row):
         products_df = products_df[actual_cols + other_cols]
         return products_df
 
-user = os.environ['PROXY_USER']
-password = os.environ['PROXY_PASSWORD']
-proxy_host = os.environ['PROXY_HOST']
-proxy_port = os.environ['PROXY_PORT']
-
-proxy_string = f"{user}:{password}@{proxy_host}:{proxy_port}"
 
-if __name__ == "__main__":
-    with SB(uc=True, headless=False, xvfb=True, maximize=True,
-            proxy=proxy_string) as sb:
+def discover_categories():
+    proxy = worker_proxy()
+    with open_browser(uc=True, headless=False, xvfb=True, maximize=True,
+                      proxy=proxy) as sb:
         
         sb.driver.execute_cdp_cmd(
                         "Network.setExtraHTTPHeaders",
@@ -180,13 +219,9 @@ if __name__ == "__main__":
 
         url = "https://www.capterra.com/categories/"
 
-        sb.activate_cdp_mode(url)
-        print("Getting All Categories...")
-        sb.sleep(7)
-        sb.save_screenshot('result.png')
-        html = sb.get_page_source()
+        html = fetch_page(sb, url, 'capterra', open_categories_page, listing=False, proxy=proxy)
         print(html)
-        soup = BeautifulSoup(html, 'html.parser')
+        soup = parse_page(html)
         list_raw = soup.select_one("div[data-testid*='alphabetical-list']")
         list_all = list_raw.select("li[data-testid*='group-list-item']")
         categories_data = []
@@ -211,19 +246,27 @@ if __name__ == "__main__":
         print(all_categories_df)
 
         all_categories_df = all_categories_df.iloc[:400]
-        # Split DataFrame into 4 parts
-        split_dfs = np.array_split(all_categories_df, 4)
-        all_results = []
-
-        # Example: process each part in a loop (can also use multiple pools if needed)
-        for idx, part_df in enumerate(split_dfs):
-            print(f"Processing part {idx+1} with {len(part_df)} categories")
-            rows = [row.to_dict() for _, row in part_df.iterrows()]
-            with multiprocessing.Pool(processes=8) as pool:  # adjust processes as needed
-                results = pool.map(scrape_category, rows)
-                all_results.extend(results)
-            part_products_df = pd.concat(results, ignore_index=True)
-            part_products_df.to_excel(os.path.join(result_dir, f"Capsterra Results Part{idx+1}.xlsx"), index=False)
-        # breakpoint()
-        all_products_df = pd.concat(all_results, ignore_index=True)
-        all_products_df.to_excel(os.path.join(result_dir, "Capsterra Results.xlsx"), index=False)
\ No newline at end of file
+    return [row.to_dict() for _, row in all_categories_df.iterrows()]
+
+
+def save_part(idx, part_rows, results):
+    print(f"Finished part {idx+1} with {len(part_rows)} categories")
+    if EXPORT_EXCEL:
+        part_products_df = pd.concat(results, ignore_index=True)
+        part_products_df.to_excel(os.path.join(result_dir, f"Capsterra Results Part{idx+1}.xlsx"), index=False)
+
+
+def export_results(sink):
+    if EXPORT_EXCEL:
+        sink.export_excel(os.path.join(result_dir, "Capsterra Results.xlsx"))
+
+
+def site_adapter():
+    # The 4 parts are still written as they complete
+    return SiteAdapter('capterra', discover_categories, scrape_category, 'cloud_link',
+                       lambda row: row['category_name'], max_concurrency=8,
+                       n_parts=4, on_part=save_part, export=export_results)
+
+
+if __name__ == "__main__":
+    crawl([site_adapter()], processes=8, result_dir=result_dir)  # adjust processes as needed
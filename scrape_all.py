@@ -0,0 +1,39 @@
+import argparse
+import os
+
+from utils.orchestrator import crawl
+
+# Get the directory where this script is located
+script_dir = os.path.dirname(os.path.abspath(__file__))
+# Create result directory if it doesn't exist
+result_dir = os.path.join(script_dir, "result")
+os.makedirs(result_dir, exist_ok=True)
+
+SITES = ['capterra', 'getapp', 'shi', 'g2']
+
+
+def load_adapter(site):
+    if site == 'capterra':
+        import capsterra_test as module
+    elif site == 'getapp':
+        import scrape_getapp as module
+    elif site == 'shi':
+        import scrape_shi as module
+    elif site == 'g2':
+        import scrape_g2 as module
+    else:
+        raise ValueError(f"Unknown site: {site}")
+    return module.site_adapter()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape several sites over one shared browser pool.")
+    parser.add_argument('--sites', default=','.join(SITES), help="comma-separated subset of sites")
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--browsers-per-worker', type=int, default=int(os.environ.get('BROWSERS_PER_WORKER', 2)),
+                        help="browsers a worker keeps open for sites with different SB options")
+    # --excel, --resume, --delta and --replay are read by the utils modules themselves
+    args, _ = parser.parse_known_args()
+
+    adapters = [load_adapter(site.strip()) for site in args.sites.split(',') if site.strip()]
+    crawl(adapters, processes=args.processes, result_dir=result_dir, max_sessions=args.browsers_per_worker)
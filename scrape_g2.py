@@ -1,5 +1,13 @@
 import os
 from utils.g2_helper import *
+from utils.parsing import parse_page
+from utils.browser_pool import open_browser
+from utils.category_snapshot import cached_discovery
+from utils.page_cache import fetch_page
+from utils.output_sink import EXPORT_EXCEL
+from utils.orchestrator import SiteAdapter, crawl
+from utils.stage_timing import stage
+from utils.proxy_pool import worker_proxy
 
 # Get the directory where this script is located
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -15,63 +23,47 @@ os.makedirs(result_dir, exist_ok=True)
 def scrape_row(row):
     return scrape_categories(row)
 
-user = os.environ['PROXY_USER']
-password = os.environ['PROXY_PASSWORD']
-proxy_host = os.environ['PROXY_HOST']
-proxy_port = os.environ['PROXY_PORT']
-
-proxy_string = f"{user}:{password}@{proxy_host}:{proxy_port}"
-
-if __name__ == "__main__":
-    with SB(uc=True, headless=False, 
-            xvfb=True, maximize=True,
-            #proxy=proxy_string
-            ) as sb:
-        print("Getting G2 Categories...")
-        url = "https://www.g2.com/categories/"
 
+def open_categories_page(sb, url):
+    with stage('open', 'g2'):
         sb.activate_cdp_mode(url)
-        sb.sleep(5)
+    sb.sleep(5)
 
-        html = sb.get_page_source()
-        soup = BeautifulSoup(html, 'html.parser')
-        print(soup)
-        tables = soup.select("table")
 
-        categories = []
-        for table in tables:
-            categories.extend(extract_categories(table))
+# Bump when the discovered row layout changes, so older snapshots are ignored
+CATEGORY_SNAPSHOT_VERSION = 1
 
-    categories_df = pd.DataFrame(categories)
-    print("Succesfully extracted len:", len(categories_df) )
-    print(categories_df.head(5))
 
-    print("Filtering categories..")
+def discover_category_tree():
+    with open_browser(uc=True, headless=False,
+                      xvfb=True, maximize=True,
+                      #proxy=worker_proxy()
+                      ) as sb:
+        print("Getting G2 Categories...")
+        url = "https://www.g2.com/categories/"
 
-    parent_cat1 = categories_df.loc[categories_df['category_2'].notna(), 'category_1'].unique()
-    parent_cat2 = categories_df.loc[categories_df['category_3'].notna(), 'category_2'].unique()
-    parent_cat3 = categories_df.loc[categories_df['category_4'].notna(), 'category_3'].unique()
+        html = fetch_page(sb, url, 'g2', open_categories_page, listing=False)
+    soup = parse_page(html)
+    tree = CategoryTree.from_tables(soup.select("table"))
+    rows = list(tree.leaves())
+    print(f"Succesfully extracted {len(rows)} leaf categories under {len(tree.roots)} top-level ones")
+    return rows
 
-    mask1 = categories_df['category_1'].isin(parent_cat1) & categories_df['category_2'].isna()
-    mask2 = categories_df['category_2'].isin(parent_cat2) & categories_df['category_3'].isna()
-    mask3 = categories_df['category_3'].isin(parent_cat3) & categories_df['category_4'].isna()
 
-    # Combine the individual masks into a single mask.
-    combined_mask = mask1 | mask2 | mask3
+def discover_categories():
+    """G2's leaf categories, from the snapshot in cache/categories/g2.json while it is fresh."""
+    return cached_discovery('g2', CATEGORY_SNAPSHOT_VERSION, discover_category_tree)
 
-    filtered_df = categories_df[~combined_mask].reset_index(drop=True)
 
-    filtered_df['last_category_link'] = filtered_df[
-        ['category_4_link', 'category_3_link', 'category_2_link', 'category_1_link']
-    ].bfill(axis=1).iloc[:, 0]
+def export_results(sink):
+    if EXPORT_EXCEL:
+        sink.export_excel(os.path.join(result_dir, "G2 Result.xlsx"))
 
-    print("Succesfully filtered the df")
-    #filtered_df
-    
-    rows = [row for _, row in filtered_df.iterrows()]
-    with multiprocessing.Pool(processes=4) as pool:  # Adjust 'processes' as needed
-        results = pool.map(scrape_row, rows)
 
-    final_df = pd.concat(results, ignore_index=True)
-    final_df.to_excel(os.path.join(result_dir, "G2 Result.xlsx"), index=False)
+def site_adapter():
+    return SiteAdapter('g2', discover_categories, scrape_row, 'last_category_link',
+                       lambda row: row['last_category_link'], max_concurrency=4, export=export_results)
 
+
+if __name__ == "__main__":
+    crawl([site_adapter()], processes=4, result_dir=result_dir)  # Adjust 'processes' as needed
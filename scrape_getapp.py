@@ -7,10 +7,21 @@ import random
 from functools import partial
 import curl_cffi
 from seleniumbase import SB
+from utils.browser_pool import borrow_browser, open_browser
+from utils.page_cache import fetch_page
+from utils.scheduler import UNCHANGED, FanOut, note_pages, should_fan_out, unchanged_since_last_run
+from utils.output_sink import EXPORT_EXCEL, ILLEGAL_CHARS
+from utils.orchestrator import SiteAdapter, crawl
+from utils.parsing import parse_page
+from utils.stage_timing import stage, timed
+from utils import visit_resolver
+from utils.dedupe import product_key
+from utils.proxy_pool import worker_proxy
 from selenium.common.exceptions import TimeoutException
 import numpy as np
 import multiprocessing
 import os
+from urllib.parse import urljoin
 from urllib3.exceptions import ReadTimeoutError
 
 # Get the directory where this script is located
@@ -19,45 +30,56 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 result_dir = os.path.join(script_dir, "result")
 os.makedirs(result_dir, exist_ok=True)
 
-# user = os.environ['PROXY_USER']
-# password = os.environ['PROXY_PASSWORD']
-# proxy_host = os.environ['PROXY_HOST']
-# proxy_port = os.environ['PROXY_PORT']
-
-# proxy_string = f"{user}:{password}@{proxy_host}:{proxy_port}"
-
-# proxies = { 
-#               "http"  : proxy_string, 
-#               "https" : proxy_string, 
-#             }
-
-def scrape_tables(products_div, row, sb):
+def outbound_link(button, header):
+    """The visit button's redirect link when the card carries one in its markup."""
+    for attr in ('href', 'data-href', 'data-url'):
+        if button.get(attr):
+            return urljoin("https://www.getapp.com", button[attr])
+    link = (button.find_parent('a', href=True) or button.select_one('a[href]')
+            or header.select_one('a[href*="/out/"], a[href*="redirect"], a[rel*="sponsored"]'))
+    return urljoin("https://www.getapp.com", link['href']) if link else None
+
+
+def click_visit_button(sb, evt_id):
+    button_selector = f'span[role="button"][data-evt-id="{evt_id}"]'
+    sb.click(button_selector)
+    sb.switch_to_window(1)
+    sb.sleep(2)
+    sb.refresh_page()
+    sb.sleep(2)
+    website_url = sb.get_current_url()
+    print("Website URL:", website_url)
+    sb.driver.close()
+    sb.switch_to_window(0)
+    return website_url
+
+
+@timed('records')
+def read_product_cards(products_div, row):
+    """Builds the records; visit-button products are returned separately with no URL yet."""
     results = []
+    visits = {}
     for product_div in products_div:
             header = product_div.select_one('div[data-testid *= "header"]')
             application_name = header.select_one('h2').get_text(strip=True)
             print(f"Getting Data for {application_name}")
+            product_link = header.select_one('a')
+            product_url = "https://www.getapp.com" + product_link['href'] if product_link else ''
             try:
                     last_header_button = header.select('span[role="button"]')[-1]
                     button_text = last_header_button.get_text(strip=True)
                     if 'visit' in button_text.lower():
-                            evt_id = last_header_button.get('data-evt-id')
-                            button_selector = f'span[role="button"][data-evt-id="{evt_id}"]'
-                            sb.click(button_selector)
-                            sb.switch_to_window(1)
-                            sb.sleep(2)
-                            sb.refresh_page()
-                            sb.sleep(2)
-                            website_url = sb.get_current_url()
-                            print("Website URL:", website_url)
-                            sb.driver.close()
-                            sb.switch_to_window(0)
+                            # Resolved below for the whole page at once
+                            key = product_key('getapp', {'Product Link': product_url, 'Application Name': application_name})
+                            visits[len(results)] = (key, product_url,
+                                                    last_header_button.get('data-evt-id'),
+                                                    outbound_link(last_header_button, header))
+                            website_url = None
                     else:
                             website_url = ''
             except Exception as e:
                     # print(f"{application_name} does not contains External Link")
-                    website_url = header.select_one('a')['href']
-                    website_url = "https://www.getapp.com" + website_url
+                    website_url = product_url
 
             description_raw = product_div.select_one("div[data-testid*='description']")
             description = description_raw.get_text(strip=True) if description_raw else ''
@@ -67,51 +89,92 @@ def scrape_tables(products_div, row, sb):
                     'Category Name': row['Category Name'],
                     'Category Link': row['Web-Based Link'],
                     'Application Name': application_name,
+                    'Product Link': product_url,
                     'Website URL': website_url,
                     'Description': description
             })
+    return results, visits
+
+
+def scrape_tables(products_div, row, sb):
+    results, visits = read_product_cards(products_div, row)
+    # Products already seen in another category come from the cache; the rest are
+    # followed over HTTP concurrently, and only what that misses is clicked through
+    with stage('resolve', 'getapp'):
+        resolved = visit_resolver.resolve_all({key: link for key, _, _, link in visits.values()}, 'getapp.com')
+        for index, (key, product_url, evt_id, _) in visits.items():
+            website_url = resolved.get(key)
+            if website_url is None:
+                try:
+                    website_url = click_visit_button(sb, evt_id)
+                    visit_resolver.remember(key, website_url)
+                except Exception as e:
+                    website_url = product_url
+            results[index]['Website URL'] = website_url
     return results
 
 
 
 
+def open_browse_page(sb, url):
+    sb.uc_open(url)
+    sb.sleep(5)
+
+
+SB_OPTIONS = dict(uc=True,
+                  headless=False,
+                  maximize=True,
+                  #proxy=worker_proxy()
+                  )
+
+
+def scrape_page(sb, url, row):
+    # reuse=False: scrape_tables clicks the buttons on the live page
+    html = fetch_page(sb, url, 'getapp', reuse=False)
+    soup = parse_page(html, 'getapp')
+    all_product_divs = soup.select('div[data-evt-name*="product"]')
+    return scrape_tables(all_product_divs, row, sb)
+
+
+def scrape_category_page(row, url, context=None):
+    """Fan-out task: one pagination page of a large category, on any free worker."""
+    print(f"Scraping {url}")
+    with borrow_browser(**SB_OPTIONS) as sb:
+        return scrape_page(sb, url, row)
+
+
 def scrape_category(row, retries=3, delay=5):
     link = row['Web-Based Link']
     print(f"Starting to Scrape Category: {row['Category Name']}")
 
     for attempt in range(retries):
         try:
-            with SB(uc=True, 
-                    headless=False, 
-                    maximize=True,
-                    #proxy=proxy_string
-                    ) as sb:
+            with borrow_browser(**SB_OPTIONS) as sb:
                 print(f"Attempt {attempt + 1}/{retries} for {row['Category Name']}")
-                sb.uc_open(link)
-                sb.sleep(7)
-
-                html = sb.get_page_source()
+                # reuse=False: scrape_tables clicks the buttons on the live page
+                html = fetch_page(sb, link, 'getapp', reuse=False)
                         # Parsing HTML menggunakan BeautifulSoup
-                soup = BeautifulSoup(html, 'html.parser')
+                soup = parse_page(html, 'getapp')
 
                 pagination_raw = soup.select_one('div[class*="Pagination"]')
                 pagination_text = pagination_raw.select_one('p').get_text(strip=True) if pagination_raw else ""
                 match = re.findall(r'\d+', pagination_text)
                 last_page = int(match[-1]) if match else 1
+                note_pages(last_page)
 
                 all_product_divs = soup.select('div[data-evt-name*="product"]')
                 result_list = scrape_tables(all_product_divs, row, sb)
-
-                for i in range(2, last_page + 1):
-                    url = link + f"?page={i}"
+                if unchanged_since_last_run(last_page, result_list):
+                    print(f"{row['Category Name']} unchanged since the last run")
+                    return UNCHANGED
+
+                page_urls = [link + f"?page={i}" for i in range(2, last_page + 1)]
+                if should_fan_out(page_urls):
+                    return FanOut(result_list, page_urls, scrape_category_page)
+                for url in page_urls:
                     print(f"Scraping {url}")
                     # sb.cdp.open(url)
-                    sb.uc_open(url)
-                    sb.sleep(7)
-                    html = sb.get_page_source()
-                    soup = BeautifulSoup(html, 'html.parser')
-                    all_product_divs = soup.select('div[data-evt-name*="product"]')
-                    result_list.extend(scrape_tables(all_product_divs, row, sb))
+                    result_list.extend(scrape_page(sb, url, row))
                 
                 products_df = pd.DataFrame(result_list)
                 print(f"Finished Scraping Category: {row['Category Name']}")
@@ -137,25 +200,22 @@ def scrape_category(row, retries=3, delay=5):
 
 def clean_illegal_chars(df):
     # Remove illegal characters from all string columns
-    illegal_pattern = re.compile(r'[\x00-\x1F\x7F-\x9F]')
     for col in df.select_dtypes(include=['object']):
-        df[col] = df[col].astype(str).apply(lambda x: illegal_pattern.sub('', x))
+        df[col] = df[col].astype(str).apply(lambda x: ILLEGAL_CHARS.sub('', x))
     return df
 
 
 
-if __name__ == "__main__":
+def discover_categories():
     url = "https://www.getapp.com/browse/"
 
-    with SB(uc=True, headless=False, 
-            xvfb=True,
-            maximize=True,
-            #proxy=proxy_string
-            ) as sb:
-        sb.uc_open(url)
-        sb.sleep(5)
-        html = sb.get_page_source()
-        soup = BeautifulSoup(html, 'html.parser')
+    with open_browser(uc=True, headless=False,
+                      xvfb=True,
+                      maximize=True,
+                      #proxy=worker_proxy()
+                      ) as sb:
+        html = fetch_page(sb, url, 'getapp', open_browse_page, listing=False)
+        soup = parse_page(html)
 
     # print(soup)
 
@@ -183,31 +243,38 @@ if __name__ == "__main__":
 
     print(f"Total Categories Found: {len(all_categories_df)}")
 
-    # all_categories_df
-    split_dfs = np.array_split(all_categories_df, 5)
-    all_results = []
+    return [row for _, row in all_categories_df.iterrows()]
 
-    for idx, split_df in enumerate(split_dfs):
-        print(f"Processing split {idx + 1}/{len(split_dfs)}")
 
-        scrape_with_retries = partial(scrape_category, retries=3, delay=10)
-        num_processes = 4
-        print(f"Starting pool with {num_processes} processes...")
+def save_split(idx, split_rows, split_results):
+    print(f"Finished split {idx + 1} with {len(split_rows)} categories")
+    if not EXPORT_EXCEL:
+        return
+    split_results = [df for df in split_results if not df.empty]
+    if split_results:
+         split_products_df = pd.concat(split_results, ignore_index=True)
+         split_products_df = clean_illegal_chars(split_products_df)  # Clean before saving
+         output_path = os.path.join(result_dir, f"GetApp Products Results Part {idx + 1}.xlsx")
+         split_products_df.to_excel(output_path, index=False)
+         print(f"Saved split {idx + 1} results to {output_path}")
 
-        with multiprocessing.Pool(processes=num_processes) as pool:
-            split_results = pool.map(scrape_with_retries, [row for _, row in split_df.iterrows()])
-            all_results.extend(split_results)
-        
-        split_results = [df for df in split_results if not df.empty]
-        if split_results:
-             split_products_df = pd.concat(split_results, ignore_index=True)
-             split_products_df = clean_illegal_chars(split_products_df)  # Clean before saving
-             output_path = os.path.join(result_dir, f"GetApp Products Results Part {idx + 1}.xlsx")
-             split_products_df.to_excel(output_path, index=False)
-             print(f"Saved split {idx + 1} results to {output_path}")
-        
 
-    final_results_df = pd.concat([df for df in all_results if not df.empty], ignore_index=True)
-    final_results_df = clean_illegal_chars(final_results_df)  
-    final_results_df.to_excel(os.path.join(result_dir, "GetApp All Products Results.xlsx"), index=False)
+def export_results(sink):
+    if EXPORT_EXCEL:
+        sink.export_excel(os.path.join(result_dir, "GetApp All Products Results.xlsx"))
     print("Finished processing all splits.")
+
+
+def site_adapter():
+    # The same category can sit under several parents, so key on both; the 5 splits
+    # are still written as they complete
+    return SiteAdapter('getapp', discover_categories, partial(scrape_category, retries=3, delay=10),
+                       ('Parent Category', 'Web-Based Link'),
+                       lambda row: f"{row['Parent Category']} - {row['Category Name']}", max_concurrency=4,
+                       n_parts=5, on_part=save_split, export=export_results)
+
+
+if __name__ == "__main__":
+    num_processes = 4
+    print(f"Starting pool with {num_processes} processes...")
+    crawl([site_adapter()], processes=num_processes, result_dir=result_dir)
@@ -7,6 +7,18 @@ import random
 from functools import partial
 import curl_cffi
 from seleniumbase import SB
+from utils.browser_pool import BrowserPool, borrow_browser, open_browser
+from utils.category_snapshot import cached_discovery
+from utils.page_cache import fetch_page
+from utils.checkpoint import DELTA
+from utils.scheduler import UNCHANGED, FanOut, note_pages, should_fan_out, unchanged_since_last_run
+from utils.orchestrator import SiteAdapter, crawl
+from utils.page_wait import wait_for_page
+from utils.challenge import handle_challenge
+from utils.parsing import parse_page
+from utils.hybrid_fetch import HybridFetcher
+from utils.proxy_pool import worker_proxy
+from utils.stage_timing import stage
 from selenium.common.exceptions import TimeoutException
 import numpy as np
 import multiprocessing
@@ -19,24 +31,14 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 result_dir = os.path.join(script_dir, "result")
 os.makedirs(result_dir, exist_ok=True)
 
-user = os.environ['PROXY_USER']
-password = os.environ['PROXY_PASSWORD']
-proxy_host = os.environ['PROXY_HOST']
-proxy_port = os.environ['PROXY_PORT']
-
-proxy_string = f"{user}:{password}@{proxy_host}:{proxy_port}"
-
-# proxies = { 
-#               "http"  : proxy_string, 
-#               "https" : proxy_string, 
-#             }
 
 
 def sb_uc_open_with_retry(sb, url, max_attempts=3, sleep_time=4):
     for attempt in range(1, max_attempts + 1):
         try:
-            sb.uc_open_with_reconnect(url, 5)
-            sb.sleep(sleep_time)
+            with stage('open', 'shi'):
+                sb.uc_open_with_reconnect(url, 5)
+            wait_for_page(sb, 'shi')
             return True
         except Exception as e:
             print(f"Attempt {attempt} failed for {url}: {e}")
@@ -47,6 +49,29 @@ def sb_uc_open_with_retry(sb, url, max_attempts=3, sleep_time=4):
     return False
 
 
+def solve_captcha(sb):
+    sb.uc_gui_click_captcha()
+    sb.sleep(10)
+    sb.uc_gui_handle_captcha()
+
+
+def open_software_page(sb, url):
+    with stage('open', 'shi'):
+        sb.uc_open_with_reconnect(url, 5)
+    #sb.sleep(4)
+
+    #sb.activate_cdp_mode(url)
+    sb.sleep(4)
+    handle_challenge(sb, 'shi', solve_captcha)
+
+
+def open_category_tree_page(sb, url):
+    sb.uc_open(url)
+    sb.sleep(3)
+    # Pool browsers have not been through the captcha on the software page yet
+    handle_challenge(sb, 'shi', solve_captcha)
+
+
 def get_product_overview(product_div, row):
         
     result = dict(row)
@@ -126,49 +151,129 @@ def get_product_overview(product_div, row):
     return result
 
 
+# The proxy comes from the pool per worker: borrow_browser(proxy=worker_proxy(), **SB_OPTIONS)
+SB_OPTIONS = dict(uc=True,
+                  headless=False,
+                  maximize=True,
+                  )
+
+
+PRODUCTS_SELECTOR = 'div[id="srResultsDiv"] div.row.srProduct'
+# SHI's search takes ?p=<offset>, <page size>; the site's own links go 20 at a time
+DEFAULT_PAGE_SIZE = 20
+# Page size asked for first; lowered to whatever the server actually returns per page
+_page_size = int(os.environ.get('SHI_PAGE_SIZE', 100))
+TOTAL_RESULTS = re.compile(r'of\s*(?:<[^>]*>\s*)*([\d,]+)\s*(?:<[^>]*>\s*)*(?:results|items|products)', re.IGNORECASE)
+
+
+def page_url(link, offset, size):
+    return link + f"?p={offset}, {size}"
+
+
+def total_results(html):
+    """The "... of N results" count on a listing page, or None if the page does not show one."""
+    match = TOTAL_RESULTS.search(html)
+    return int(match.group(1).replace(',', '')) if match else None
+
+
+def scrape_overview_page(fetcher, page_url, row):
+    html = fetcher.get_html(page_url)
+    soup = parse_page(html, 'shi')
+    current_page_products_raw = soup.select(PRODUCTS_SELECTOR)
+    with stage('records', 'shi'):
+        return [get_product_overview(product_div, row) for product_div in current_page_products_raw]
+
+
+def scrape_overview_page_task(row, page_url, context=None):
+    """Fan-out task: one pagination page of a large category, on any free worker."""
+    print(f"{row['Last Category Name']} - Processing {page_url}")
+    proxy = worker_proxy()
+    with borrow_browser(proxy=proxy, **SB_OPTIONS) as sb:
+        fetcher = HybridFetcher(sb, 'shi', proxy=proxy, open_page=sb_uc_open_with_retry)
+        return scrape_overview_page(fetcher, page_url, row)
+
+
+def load_first_page(sb, link, proxy=None):
+    """Page 1 at the largest page size SHI serves: (soup, product divs, page size, total results).
+
+    A page size the server refuses comes back as an empty page for a category
+    that does have products; the size is halved until one works.
+    """
+    global _page_size
+    while True:
+        size = _page_size
+        html = fetch_page(sb, page_url(link, 0, size), 'shi', sb_uc_open_with_retry, reuse=not DELTA,
+                          proxy=proxy)
+        if html is None:
+            return None, [], size, None
+        soup = parse_page(html, 'shi')
+        products_raw = soup.select(PRODUCTS_SELECTOR)
+        total = total_results(html)
+        has_results = total or soup.select('div[class*="searchPages"]')
+        if products_raw or size <= DEFAULT_PAGE_SIZE or not has_results:
+            break
+        _page_size = max(DEFAULT_PAGE_SIZE, size // 2)
+        print(f"SHI returned nothing for {size} per page, trying {_page_size}")
+    more_pages = len(products_raw) < total if total is not None else soup.select('div[class*="searchPages"]')
+    if 0 < len(products_raw) < size and more_pages:
+        # Fewer than asked for, yet more to come: that is the most the server will send per page
+        size = _page_size = len(products_raw)
+        print(f"SHI serves at most {size} products per page")
+    return soup, products_raw, size, total
+
+
 def scrape_app_overview_from_categories(row):
     link = row['Last Category Link']
     print(f"Starting to Scrape Category: {row['Last Category Name']}")
-    with SB(uc=True, 
-            headless=False, 
-            maximize=True,
-            proxy=proxy_string
-            ) as sb:
+    proxy = worker_proxy()
+    with borrow_browser(proxy=proxy, **SB_OPTIONS) as sb:
         try:
-            success = sb_uc_open_with_retry(sb, link, max_attempts=3, sleep_time=4)
-            sb.sleep(3)
-            if not success:
+            soup, all_products_raw, size, total = load_first_page(sb, link, proxy)
+            if soup is None:
                 print(f"Failed to load {link} after 3 attempts. Skipping this category.")
                 product_overview_result = []
             else:
-                html = sb.get_page_source()
-                soup = BeautifulSoup(html, 'html.parser')
-
-                try:
-                    raw_pagination = soup.select('div[class*="searchPages"]')[-1]
-                    last_page_raw = raw_pagination.find_all("a")[-1]
-                    n_pages = int(last_page_raw.get_text(strip=True))
-                except Exception as e:
+                if total is not None:
+                    n_pages = max(1, -(-total // size))
+                elif soup.select('div[class*="searchPages"]') or len(all_products_raw) >= size:
+                    # No result count on the page: walk the pages until a short one
+                    n_pages = None
+                else:
                     print(f"{row['Last Category Name']} only have 1 page")
                     n_pages = 1
-
-                all_products_raw = soup.select('div[id="srResultsDiv"] div.row.srProduct')
-                product_overview_result = [get_product_overview(product_div, row) for product_div in all_products_raw]
-
-                for i in range(2, n_pages + 1):
+                note_pages(n_pages)
+
+                with stage('records', 'shi'):
+                    product_overview_result = [get_product_overview(product_div, row) for product_div in all_products_raw]
+                if unchanged_since_last_run(n_pages, product_overview_result):
+                    print(f"{row['Last Category Name']} unchanged since the last run")
+                    return UNCHANGED
+
+                page_urls = [page_url(link, size * (i - 1), size) for i in range(2, (n_pages or 1) + 1)]
+                if should_fan_out(page_urls):
+                    return FanOut(product_overview_result, page_urls, scrape_overview_page_task)
+                fetcher = HybridFetcher(sb, 'shi', proxy=proxy,
+                                        open_page=sb_uc_open_with_retry) if page_urls or n_pages is None else None
+                for i, next_url in enumerate(page_urls, start=2):
                     print(f"{row['Last Category Name']} - Processing page {i} of {n_pages}")
-                    n_start = 20 * (i - 1)
-                    page_url = link + f"?p={20 * (i - 1)}, 20"
-                    success = sb_uc_open_with_retry(sb, page_url, max_attempts=3, sleep_time=4)
-                    sb.sleep(3)
-                    if not success:
-                        print(f"Failed to load {page_url} after 3 attempts. Skipping this page.")
+                    try:
+                        product_overview_result.extend(scrape_overview_page(fetcher, next_url, row))
+                    except Exception as e:
+                        print(f"Failed to load {next_url}: {e}. Skipping this page.")
                         continue
-                    html = sb.get_page_source()
-                    soup = BeautifulSoup(html, 'html.parser')
-                    current_page_products_raw = soup.select('div[id="srResultsDiv"] div.row.srProduct')
-                    current_page_products_result = [get_product_overview(product_div, row) for product_div in current_page_products_raw]
-                    product_overview_result.extend(current_page_products_result)
+                offset = size
+                while n_pages is None:
+                    next_url = page_url(link, offset, size)
+                    print(f"{row['Last Category Name']} - Processing {next_url}")
+                    try:
+                        page_records = scrape_overview_page(fetcher, next_url, row)
+                    except Exception as e:
+                        print(f"Failed to load {next_url}: {e}. Stopping here.")
+                        break
+                    product_overview_result.extend(page_records)
+                    offset += size
+                    if len(page_records) < size:
+                        break
         except Exception as e:
             print(f"Exception occurred while loading {link}: {e}")
             product_overview_result = []
@@ -176,103 +281,100 @@ def scrape_app_overview_from_categories(row):
     return product_overview_result
 
 
-if __name__ == "__main__":
+# Bump when the discovered row layout changes, so older snapshots are ignored
+CATEGORY_SNAPSHOT_VERSION = 1
+DISCOVERY_PROCESSES = int(os.environ.get('SHI_DISCOVERY_PROCESSES', 4))
+
+TREE_OPTIONS = dict(uc=True,
+                    headless=False,
+                    xvfb=True,
+                    #maximize=True,
+                    test=True,
+                    #proxy=worker_proxy()
+                    )
+
+
+def discover_category_3(row):
+    """Pool task: the category 3 rows under one category 2 (or the row itself if it has none)."""
+    print(f"Getting Category 3 for {row['Category 2 Name']}")
+    link = row['Category 2 Link']
+    with borrow_browser(**TREE_OPTIONS) as sb:
+        html = fetch_page(sb, link, 'shi', open_category_tree_page, listing=False)
+
+    cat3_result = []
+    try:
+        soup = parse_page(html)
+        cat_list = soup.select_one('div[class*="categoryList"]').select_one('ol').select_one("li")
+        cat3_raw = cat_list.select_one('ol[id*="ctgy1software"]').select_one('li[class*="srCat"]').select_one('ol[id*="ctgy1software"]').select('li[class*="srCat"]')
+        print(f"{row['Category 2 Name']} have Category 3")
+
+        for cat3_list in cat3_raw:
+            cat_3_a_tag = cat3_list.select_one('a')
+            cat3_name = cat_3_a_tag.find(string=True, recursive=False)
+            cat3_link = cat_3_a_tag['href']
+            cat3_link = "https://www.shi.com" + cat3_link
+
+            cur_result = {
+                'Category 1 Name': row['Category 1 Name'],
+                'Category 1 Link': row['Category 1 Link'],
+                'Category 2 Name': row['Category 2 Name'],
+                'Category 2 Link': row['Category 2 Link'],
+                'Category 3 Name': str(cat3_name) if cat3_name is not None else None,
+                'Category 3 Link': cat3_link
+            }
+            cat3_result.append(cur_result)
+
+    except Exception as e:
+        print(f"{row['Category 2 Name']} does not have Category 3")
+        cat3_result.append({
+            'Category 1 Name': row['Category 1 Name'],
+            'Category 1 Link': row['Category 1 Link'],
+            'Category 2 Name': row['Category 2 Name'],
+            'Category 2 Link': row['Category 2 Link'],
+            'Category 3 Name': None,
+            'Category 3 Link': None
+        })
+    return cat3_result
+
+
+def discover_category_tree():
     url = "https://www.shi.com/shop/search/software"
     print("Getting All Categories")
 
-    with SB(uc=True, 
-            headless=False, 
-            xvfb=True,
-            #maximize=True,
-            test=True,
-            #proxy=proxy_string
-            ) as sb:
+    with open_browser(**TREE_OPTIONS) as sb:
 
-        sb.uc_open_with_reconnect(url, 5)
-        #sb.sleep(4)
+        html = fetch_page(sb, url, 'shi', open_software_page, listing=False)
 
-        #sb.activate_cdp_mode(url)
-        sb.sleep(4)
-        sb.uc_gui_click_captcha()
-        sb.sleep(10)
-        sb.uc_gui_handle_captcha()
+    soup = parse_page(html)
+    print(soup)
 
-        html = sb.get_page_source()
+    cat_list = soup.select_one('div[class*="categoryList"]').select_one('ol').select_one("li")
+    cat1_link = cat_list.select_one('a')['href']
+    cat1_link = "https://www.shi.com" + cat1_link
+    cat1_name = cat_list.select_one('a').get_text(strip=True)
 
-        soup = BeautifulSoup(html, 'html.parser')
-        print(soup)
+    cat2_raw_list = cat_list.select_one('ol[id*="ctgy1software"]').select("li[class*='srCat']")
 
-        cat_list = soup.select_one('div[class*="categoryList"]').select_one('ol').select_one("li")
-        cat1_link = cat_list.select_one('a')['href']
-        cat1_link = "https://www.shi.com" + cat1_link
-        cat1_name = cat_list.select_one('a').get_text(strip=True)
+    cat2_results = []
+    for cat2_list in cat2_raw_list:
+        cat_2_a_tag = cat2_list.select_one('a')
+        cat2_name = cat_2_a_tag.find(string=True, recursive=False)
+        cat2_link = cat_2_a_tag['href']
+        cat2_link = "https://www.shi.com" + cat2_link
 
-        cat2_raw_list = cat_list.select_one('ol[id*="ctgy1software"]').select("li[class*='srCat']")
+        cur_result = {
+            'Category 1 Name': cat1_name,
+            'Category 1 Link': cat1_link,
+            'Category 2 Name': str(cat2_name) if cat2_name is not None else None,
+            'Category 2 Link': cat2_link
+        }
+        cat2_results.append(cur_result)
 
-        cat2_results = []
-        for cat2_list in cat2_raw_list:
-            cat_2_a_tag = cat2_list.select_one('a')
-            cat2_name = cat_2_a_tag.find(string=True, recursive=False)
-            cat2_link = cat_2_a_tag['href']
-            cat2_link = "https://www.shi.com" + cat2_link
-
-            cur_result = {
-                'Category 1 Name': cat1_name,
-                'Category 1 Link': cat1_link,
-                'Category 2 Name': cat2_name,
-                'Category 2 Link': cat2_link
-            }
-            cat2_results.append(cur_result)
-
-        cat2_df = pd.DataFrame(cat2_results)
-
-        cat3_result = []
-        for i, row in cat2_df.iterrows():
-            print(f"Processing row {i+1} of {len(cat2_df)}")
-            print(row['Category 2 Name'])
-            print(row['Category 2 Link'])
-            print()
-            print(f"Getting Category 3 for {row['Category 2 Name']}")
-            link = row['Category 2 Link']
-
-            sb.uc_open(link)
-            sb.sleep(3)
-
-            html = sb.get_page_source()
-
-            soup = BeautifulSoup(html, 'html.parser')
-            cat_list = soup.select_one('div[class*="categoryList"]').select_one('ol').select_one("li")
-
-            try:
-                cat3_raw = cat_list.select_one('ol[id*="ctgy1software"]').select_one('li[class*="srCat"]').select_one('ol[id*="ctgy1software"]').select('li[class*="srCat"]')
-                print(f"{row['Category 2 Name']} have Category 3")
-
-                for cat3_list in cat3_raw:
-                    cat_3_a_tag = cat3_list.select_one('a')
-                    cat3_name = cat_3_a_tag.find(string=True, recursive=False)
-                    cat3_link = cat_3_a_tag['href']
-                    cat3_link = "https://www.shi.com" + cat3_link
-
-                    cur_result = {
-                        'Category 1 Name': row['Category 1 Name'],
-                        'Category 1 Link': row['Category 1 Link'],
-                        'Category 2 Name': row['Category 2 Name'],
-                        'Category 2 Link': row['Category 2 Link'],
-                        'Category 3 Name': cat3_name,
-                        'Category 3 Link': cat3_link
-                    }
-                    cat3_result.append(cur_result)
-
-            except Exception as e:
-                print(f"{row['Category 2 Name']} does not have Category 3")
-                cat3_result.append({
-                    'Category 1 Name': row['Category 1 Name'],
-                    'Category 1 Link': row['Category 1 Link'],
-                    'Category 2 Name': row['Category 2 Name'],
-                    'Category 2 Link': row['Category 2 Link'],
-                    'Category 3 Name': None,
-                    'Category 3 Link': None
-                })
+    # Each category 2 page is its own task, spread over the pool like the product pages
+    print(f"Getting Category 3 for {len(cat2_results)} categories on {DISCOVERY_PROCESSES} workers")
+    with BrowserPool(processes=DISCOVERY_PROCESSES) as pool:
+        cat3_lists = pool.map(discover_category_3, cat2_results)
+    cat3_result = [cat3_row for cat3_rows in cat3_lists for cat3_row in cat3_rows]
 
     cat3_df = pd.DataFrame(cat3_result)
     cat3_df['Last Category Name'] = cat3_df[['Category 3 Name', 'Category 2 Name', 'Category 1 Name']].bfill(axis=1).iloc[:, 0]
@@ -293,20 +395,24 @@ if __name__ == "__main__":
             'Last Category Link': str(row['Last Category Link']) if row['Last Category Link'] is not None else None,
         }
         list_of_rows.append(clean_row)
-        
-    num_processes = 4
-    all_results = []
+    return list_of_rows
 
-    print("Starting to Scrape All Categories Overview..")
 
-    with multiprocessing.Pool(processes=num_processes) as pool:
-        # Pass the list of dictionaries to the pool
-        # The scrape_app_overview_from_categories function will receive a dictionary
-        split_results = pool.map(scrape_app_overview_from_categories, list_of_rows)
+def discover_categories():
+    """The category 1/2/3 tree, from the snapshot in cache/categories/shi.json while it is fresh."""
+    return cached_discovery('shi', CATEGORY_SNAPSHOT_VERSION, discover_category_tree)
 
-        all_results = [item for sublist in split_results for item in sublist]
-    
-    all_overview_result_df = pd.DataFrame(all_results)
 
-    all_overview_result_df.to_csv(os.path.join(result_dir, "SHI All Product Overview.csv"), index=False)
-    # breakpoint()
\ No newline at end of file
+def export_results(sink):
+    sink.export_csv(os.path.join(result_dir, "SHI All Product Overview.csv"))
+
+
+def site_adapter():
+    return SiteAdapter('shi', discover_categories, scrape_app_overview_from_categories, 'Last Category Link',
+                       lambda row: row['Last Category Link'], max_concurrency=4,
+                       as_frame=False, export=export_results)
+
+
+if __name__ == "__main__":
+    num_processes = 4
+    crawl([site_adapter()], processes=num_processes, result_dir=result_dir)
@@ -0,0 +1,252 @@
+import multiprocessing
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from multiprocessing import util
+
+from seleniumbase import SB
+
+from utils import page_cache
+
+
+def _new_stats():
+    return {'tasks': 0, 'starts': 0, 'recycles': 0, 'startup_seconds': 0.0}
+
+
+class BrowserSession:
+    """One long-lived SB(...) session that a worker process reuses across categories."""
+
+    def __init__(self, max_tasks=50, stats=None):
+        self.max_tasks = max_tasks
+        self.sb = None
+        self._cm = None
+        self._sb_kwargs = None
+        self.tasks_on_session = 0
+        # Sessions of one worker share a stats dict
+        self.stats = stats if stats is not None else _new_stats()
+
+    def start(self, **sb_kwargs):
+        from utils import warm_start
+        started = time.perf_counter()
+        browser_kwargs, warm = warm_start.browser_kwargs(sb_kwargs)
+        self._cm = open_browser(**browser_kwargs)
+        self.sb = self._cm.__enter__()
+        self._sb_kwargs = sb_kwargs
+        self.tasks_on_session = 0
+        seconds = time.perf_counter() - started
+        self.stats['starts'] += 1
+        self.stats['startup_seconds'] += seconds
+        warm_start.record(warm, seconds)
+        return self.sb
+
+    def close(self):
+        if self._cm is not None:
+            try:
+                self._cm.__exit__(None, None, None)
+            except Exception as e:
+                print(f"Error while closing browser session: {e}")
+        self._cm = None
+        self.sb = None
+
+    def recycle(self):
+        print("Recycling browser session...")
+        self.close()
+        self.stats['recycles'] += 1
+
+    def is_healthy(self):
+        """Cheap liveness probe: the driver answers and has a window we can drive."""
+        if self.sb is None:
+            return False
+        try:
+            handles = self.sb.driver.window_handles
+            if not handles:
+                return False
+            # Drop any tabs a previous category left open (e.g. GetApp "Visit website")
+            for handle in handles[1:]:
+                self.sb.driver.switch_to.window(handle)
+                self.sb.driver.close()
+            self.sb.driver.switch_to.window(handles[0])
+            self.sb.driver.current_url
+            return True
+        except Exception as e:
+            print(f"Browser session failed health check: {e}")
+            return False
+
+    def acquire(self, **sb_kwargs):
+        if self.sb is not None:
+            if sb_kwargs != self._sb_kwargs or self.tasks_on_session >= self.max_tasks:
+                self.recycle()
+            elif not self.is_healthy():
+                self.recycle()
+        if self.sb is None:
+            self.start(**sb_kwargs)
+        return self.sb
+
+    def release(self, failed=False):
+        self.tasks_on_session += 1
+        self.stats['tasks'] += 1
+        if failed and not self.is_healthy():
+            self.recycle()
+
+
+@contextmanager
+def open_browser(**sb_kwargs):
+    """`SB(**sb_kwargs)`, or a cache-backed stand-in when running with --replay."""
+    if page_cache.REPLAY:
+        yield page_cache.ReplayBrowser()
+        return
+    from utils import page_wait, worker_display
+    with SB(**sb_kwargs) as sb:
+        worker_display.isolate_session()
+        # Before the first page load, so wait_for_page can see its requests in flight
+        page_wait.track_requests(sb)
+        yield sb
+
+
+_sessions = OrderedDict()
+_worker_stats = _new_stats()
+_max_tasks = 50
+_max_sessions = 1
+_stats_queue = None
+_stats_providers = {}
+
+
+def register_worker_stats(name, collect, report, reset=None):
+    """Lets other modules ship per-worker stats back through the pool on shutdown."""
+    _stats_providers[name] = (collect, report, reset)
+
+
+def _collect_stats(browser_stats):
+    stats = {'browser': browser_stats}
+    for name, (collect, _, _) in _stats_providers.items():
+        stats[name] = collect()
+    return stats
+
+
+def _get_session(sb_kwargs):
+    """The worker's session for these SB options, keeping at most _max_sessions browsers open."""
+    key = repr(sorted(sb_kwargs.items()))
+    session = _sessions.pop(key, None)
+    if session is None:
+        while len(_sessions) >= _max_sessions:
+            _, oldest = _sessions.popitem(last=False)
+            oldest.recycle()
+        session = BrowserSession(max_tasks=_max_tasks, stats=_worker_stats)
+    # Most recently used last, so the least recently used one is evicted first
+    _sessions[key] = session
+    return session
+
+
+def _shutdown_worker():
+    for session in _sessions.values():
+        session.close()
+    _sessions.clear()
+    if _stats_queue is not None:
+        _stats_queue.put(_collect_stats(dict(_worker_stats)))
+
+
+def init_worker(stats_queue=None, max_tasks=50, max_sessions=1, record_queue=None):
+    """Pool initializer: closes the worker's browsers and reports their stats on exit.
+
+    max_sessions > 1 keeps one browser per distinct set of SB options, for pools
+    shared by sites that launch Chrome differently. record_queue is a StreamWriter's
+    queue for the worker to send its records to.
+    """
+    global _worker_stats, _max_tasks, _max_sessions, _stats_queue
+    _sessions.clear()
+    _worker_stats = _new_stats()
+    _max_tasks = max_tasks
+    _max_sessions = max_sessions
+    _stats_queue = stats_queue
+    # Forked workers inherit the parent's counters; start them from zero
+    for _, _, reset in _stats_providers.values():
+        if reset is not None:
+            reset()
+    if record_queue is not None:
+        from utils import stream_writer
+        stream_writer.attach(record_queue)
+    util.Finalize(None, _shutdown_worker, exitpriority=10)
+
+
+@contextmanager
+def borrow_browser(**sb_kwargs):
+    """Drop-in for `with SB(**sb_kwargs) as sb:` that reuses the worker's session."""
+    session = _get_session(sb_kwargs)
+    sb = session.acquire(**sb_kwargs)
+    try:
+        yield sb
+    except BaseException:
+        session.release(failed=True)
+        raise
+    else:
+        session.release()
+
+
+class BrowserPool:
+    """multiprocessing.Pool whose workers keep one browser alive for all their tasks."""
+
+    def __init__(self, processes, max_tasks=50, max_sessions=1, record_queue=None):
+        # Imported before forking, so their worker stats are registered in every worker
+        from utils import warm_start, worker_display
+        # With --warm-start, before forking so every worker inherits the template
+        warm_start.prepare()
+        self.processes = processes
+        self._stats_queue = multiprocessing.SimpleQueue()
+        self._pool = multiprocessing.Pool(
+            processes=processes,
+            initializer=init_worker,
+            initargs=(self._stats_queue, max_tasks, max_sessions, record_queue),
+        )
+        self.worker_stats = []
+
+    def map(self, func, iterable):
+        return self._pool.map(func, iterable)
+
+    def imap_unordered(self, func, iterable):
+        return self._pool.imap_unordered(func, iterable)
+
+    def apply_async(self, func, args=(), callback=None, error_callback=None):
+        return self._pool.apply_async(func, args, callback=callback, error_callback=error_callback)
+
+    def close(self):
+        # close()+join() rather than terminate() so worker finalizers get to run
+        self._pool.close()
+        self._pool.join()
+        while not self._stats_queue.empty():
+            self.worker_stats.append(self._stats_queue.get())
+
+    def report(self):
+        browser_stats = [s['browser'] for s in self.worker_stats]
+        tasks = sum(s['tasks'] for s in browser_stats)
+        starts = sum(s['starts'] for s in browser_stats)
+        recycles = sum(s['recycles'] for s in browser_stats)
+        startup_seconds = sum(s['startup_seconds'] for s in browser_stats)
+        avg_startup = startup_seconds / starts if starts else 0.0
+        saved = avg_startup * max(tasks - starts, 0)
+        print(f"Browser pool: {tasks} tasks on {starts} browser starts "
+              f"({recycles} recycled) across {len(self.worker_stats)} workers")
+        print(f"Average browser startup {avg_startup:.1f}s, "
+              f"estimated startup time saved {saved:.1f}s")
+        # Include the parent's own numbers, e.g. waits done in the __main__ session
+        parent_stats = _collect_stats(None)
+        for name, (_, report, _) in _stats_providers.items():
+            report([s[name] for s in self.worker_stats if name in s] + [parent_stats[name]])
+        return {
+            'tasks': tasks,
+            'starts': starts,
+            'recycles': recycles,
+            'avg_startup_seconds': avg_startup,
+            'saved_seconds': saved,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._pool.terminate()
+            self._pool.join()
+            return False
+        self.close()
+        self.report()
+        return False
@@ -0,0 +1,60 @@
+import json
+import os
+import sys
+import time
+
+from utils import page_cache
+
+script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNAPSHOT_DIR = os.environ.get('CATEGORY_SNAPSHOT_DIR', os.path.join(script_dir, "cache", "categories"))
+# Category trees change slowly; rediscover after a week by default
+SNAPSHOT_TTL = float(os.environ.get('CATEGORY_SNAPSHOT_TTL', 7 * 24 * 3600))
+# `python scrape_x.py --refresh-categories` rediscovers even with a fresh snapshot
+REFRESH = '--refresh-categories' in sys.argv or os.environ.get('REFRESH_CATEGORIES') == '1'
+
+
+def snapshot_path(site):
+    return os.path.join(SNAPSHOT_DIR, f"{site}.json")
+
+
+def load_snapshot(site, version, ttl=SNAPSHOT_TTL):
+    """The saved category rows, or None when missing, stale or written by another version.
+
+    With --replay any age is fine, since the pages behind it come from the cache anyway.
+    """
+    try:
+        with open(snapshot_path(site), encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if snapshot.get('version') != version:
+        return None
+    if not page_cache.REPLAY and time.time() - snapshot['created'] > ttl:
+        return None
+    return snapshot['rows']
+
+
+def save_snapshot(site, version, rows):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = snapshot_path(site)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': version, 'created': time.time(), 'rows': rows}, f, default=str)
+    os.replace(tmp_path, path)
+
+
+def cached_discovery(site, version, discover, ttl=SNAPSHOT_TTL):
+    """discover() -> category rows, skipped while the site's snapshot is fresh.
+
+    Bump version whenever discover() starts producing different columns.
+    """
+    if not REFRESH:
+        rows = load_snapshot(site, version, ttl)
+        if rows is not None:
+            print(f"Using the {site} category snapshot from {snapshot_path(site)} ({len(rows)} categories)")
+            return rows
+    rows = discover()
+    save_snapshot(site, version, rows)
+    print(f"Saved {len(rows)} {site} categories to {snapshot_path(site)}")
+    return rows
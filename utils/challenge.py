@@ -0,0 +1,86 @@
+import os
+
+from utils.browser_pool import register_worker_stats
+from utils.hybrid_fetch import CHALLENGE_MARKERS
+from utils.stage_timing import stage
+
+# Set CHALLENGE_CHECK=0 to run the GUI captcha clicks after every load again
+CHECK_ENABLED = os.environ.get('CHALLENGE_CHECK', '1') != '0'
+
+# Captcha widgets by kind, checked before the Cloudflare interstitial CHALLENGE_MARKERS;
+# the same providers resource_blocking keeps on its CHALLENGE_ALLOWLIST
+CAPTCHA_MARKERS = {
+    'turnstile': ['cf-turnstile', 'challenges.cloudflare.com/turnstile'],
+    'recaptcha': ['g-recaptcha', 'google.com/recaptcha', 'recaptcha/api.js'],
+    'hcaptcha': ['h-captcha', 'hcaptcha.com'],
+}
+KINDS = list(CAPTCHA_MARKERS) + ['interstitial']
+
+_counts = {}
+
+
+def classify(html):
+    """The challenge kind (see KINDS), or None for a page that is not a challenge.
+
+    Scans the whole document: a captcha widget can sit well below the page head.
+    """
+    html = html or ''
+    for kind, markers in CAPTCHA_MARKERS.items():
+        if any(marker in html for marker in markers):
+            return kind
+    if any(marker in html for marker in CHALLENGE_MARKERS):
+        return 'interstitial'
+    return None
+
+
+def _count(site, key):
+    counts = _counts.setdefault(site, {'fast': 0, 'unsolved': 0, **{kind: 0 for kind in KINDS}})
+    counts[key] += 1
+
+
+def handle_challenge(sb, site, solve):
+    """Runs solve(sb), the slow GUI-click path, only if the loaded page is a challenge.
+
+    Returns the challenge kind, or None when the page went straight through.
+    """
+    if not CHECK_ENABLED:
+        with stage('challenge', site):
+            solve(sb)
+        return None
+    kind = classify(sb.get_page_source())
+    if kind is None:
+        _count(site, 'fast')
+        return None
+    print(f"{kind.capitalize()} challenge on {sb.get_current_url()}, solving...")
+    _count(site, kind)
+    with stage('challenge', site):
+        solve(sb)
+    if classify(sb.get_page_source()) is not None:
+        _count(site, 'unsolved')
+    return kind
+
+
+def snapshot():
+    return {site: dict(counts) for site, counts in _counts.items()}
+
+
+def reset():
+    _counts.clear()
+
+
+def print_challenge_report(snapshots):
+    totals = {}
+    for snap in snapshots:
+        for site, counts in snap.items():
+            site_totals = totals.setdefault(site, {})
+            for key, value in counts.items():
+                site_totals[key] = site_totals.get(key, 0) + value
+    for site, counts in sorted(totals.items()):
+        challenged = sum(counts.get(kind, 0) for kind in KINDS)
+        kinds = ", ".join(f"{kind} {counts.get(kind, 0)}" for kind in KINDS)
+        print(f"Challenge check [{site}]: {counts['fast']} pages straight to extraction, "
+              f"{challenged} through the captcha path ({kinds}), {counts['unsolved']} still challenged after")
+    return totals
+
+
+register_worker_stats('challenge', snapshot, print_challenge_report, reset)
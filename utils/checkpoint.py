@@ -0,0 +1,150 @@
+import json
+import os
+import shutil
+import sys
+import time
+
+import pandas as pd
+
+# `python scrape_x.py --resume` skips categories already in the journal
+RESUME = '--resume' in sys.argv or os.environ.get('SCRAPER_RESUME') == '1'
+# `python scrape_x.py --delta` reuses last run's rows for categories whose first page is unchanged
+DELTA = '--delta' in sys.argv or os.environ.get('SCRAPER_DELTA') == '1'
+
+
+def _to_records(result):
+    if isinstance(result, pd.DataFrame):
+        return result.to_dict('records')
+    return list(result)
+
+
+def row_key(row, key_field):
+    """Journal key for a category row; key_field may be one column or a tuple of them."""
+    if isinstance(key_field, (list, tuple)):
+        return ' | '.join(str(row[field]) for field in key_field)
+    return str(row[key_field])
+
+
+def _append_entry(journal_dir, key, records, fingerprint=None, **extra):
+    # One file per worker process, so concurrent appends never interleave
+    path = os.path.join(journal_dir, f"{os.getpid()}.jsonl")
+    entry = {'key': key, 'ts': time.time(), 'records': records}
+    if fingerprint is not None:
+        entry['fingerprint'] = fingerprint
+    entry.update(extra)
+    line = json.dumps(entry, default=str)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(line + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def journal_result(journal_dir, key, result, fingerprint=None):
+    """Appends a finished category's records (and its first-page fingerprint) to the journal."""
+    records = _to_records(result)
+    # Empty results are usually failures; leave them out so --resume retries them
+    if records:
+        _append_entry(journal_dir, key, records, fingerprint)
+
+
+def journal_page(journal_dir, key, page_no, result):
+    """Appends one page of a fanned-out category; it counts once journal_pages_done() follows."""
+    # Written even when empty, so the page count in the completion entry adds up
+    _append_entry(journal_dir, key, _to_records(result), page=page_no)
+
+
+def journal_pages_done(journal_dir, key, n_pages, fingerprint=None):
+    _append_entry(journal_dir, key, [], fingerprint, complete=n_pages)
+
+
+def _read_entries(paths):
+    for path in paths:
+        try:
+            f = open(path, encoding='utf-8')
+        except OSError:
+            continue
+        with f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn last line from a crash mid-write
+                    continue
+
+
+def _assemble(entries):
+    """One entry per finished category, joining fanned-out ones journaled page by page.
+
+    Their pages sit in several workers' files, so the join waits until everything is read.
+    """
+    pages = {}
+    completed = []
+    for entry in entries:
+        if 'page' in entry:
+            pages.setdefault(entry['key'], {})[entry['page']] = entry['records']
+        elif 'complete' in entry:
+            completed.append(entry)
+        else:
+            yield entry
+    for entry in completed:
+        parts = pages.get(entry['key'], {})
+        if len(parts) < entry['complete']:
+            continue
+        entry = {key: value for key, value in entry.items() if key != 'complete'}
+        entry['records'] = [record for page_no in sorted(parts) for record in parts[page_no]]
+        yield entry
+
+
+class CategoryJournal:
+    """Append-only per-category results journal under result/journal/<site>/.
+
+    A fresh run folds the old journal into result/journal/<site>.previous.jsonl
+    before clearing it, which is what --delta compares against and reuses.
+    """
+
+    def __init__(self, site, result_dir, resume=RESUME, delta=DELTA):
+        self.site = site
+        self.journal_dir = os.path.join(result_dir, "journal", site)
+        self.previous_path = self.journal_dir + ".previous.jsonl"
+        if not resume and os.path.isdir(self.journal_dir):
+            self.rotate()
+            shutil.rmtree(self.journal_dir)
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self.done = self.load()
+        if resume:
+            print(f"Resuming {site}: {len(self.done)} categories already in the journal")
+        self.previous = self.load_previous() if delta else {}
+        if delta:
+            print(f"Delta crawl for {site}: {len(self.previous)} categories from the last run to compare against")
+
+    def _journal_files(self):
+        return [os.path.join(self.journal_dir, name) for name in sorted(os.listdir(self.journal_dir))
+                if name.endswith(".jsonl")]
+
+    def load(self):
+        return {entry['key']: entry['records'] for entry in _assemble(_read_entries(self._journal_files()))}
+
+    def records_for(self, keys):
+        """Records of just these categories, read back from the journal, in keys order."""
+        wanted = set(keys)
+        entries = (entry for entry in _read_entries(self._journal_files()) if entry['key'] in wanted)
+        found = {entry['key']: entry['records'] for entry in _assemble(entries)}
+        return [found.get(key, []) for key in keys]
+
+    def load_previous(self):
+        """{key: entry} for every category the previous runs finished with a fingerprint."""
+        return {entry['key']: entry for entry in _read_entries([self.previous_path])
+                if entry.get('fingerprint') is not None}
+
+    def rotate(self):
+        """Merges the current journal over the previous-run store; newer entries win."""
+        entries = {entry['key']: entry for entry in _read_entries([self.previous_path])}
+        current = {entry['key']: entry for entry in _assemble(_read_entries(self._journal_files()))}
+        if not current:
+            return
+        entries.update(current)
+        tmp_path = self.previous_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in entries.values():
+                f.write(json.dumps(entry, default=str) + "\n")
+        os.replace(tmp_path, self.previous_path)
@@ -0,0 +1,147 @@
+import json
+import os
+import shutil
+import time
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+from utils.checkpoint import _append_entry
+from utils.output_sink import OUTPUT_FORMAT, clean_record, pq, pa
+
+# Columns that describe the product itself; everything else in a record is category membership
+PRODUCT_COLUMNS = {
+    'capterra': ['Product Name', 'Product Link', 'Product Description'],
+    'getapp': ['Application Name', 'Product Link', 'Website URL', 'Description'],
+    'shi': ['Product ID', 'Product Name', 'Product Price', 'Product Link', 'Product Short Description',
+            'Product Manufacturer Part', 'Product SHI Part'],
+    'g2': ['Product Name', 'Product Link', 'Product Description'],
+}
+
+
+def normalize_link(url):
+    """getapp.com/software/x, https://www.GetApp.com/software/x/?a=1 and so on all map to one key."""
+    if not url:
+        return None
+    parts = urlsplit(str(url).strip())
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    return f"{host}{parts.path.rstrip('/')}".lower() or None
+
+
+def product_key(site, record):
+    """SHI part number for SHI, otherwise the normalized product link; the name as a last resort."""
+    if site == 'shi' and record.get('Product SHI Part'):
+        return f"shi:{str(record['Product SHI Part']).strip().upper()}"
+    key = normalize_link(record.get('Product Link'))
+    if key:
+        return key
+    name = record.get('Product Name') or record.get('Application Name')
+    return f"name:{str(name).strip().lower()}" if name else None
+
+
+class SharedIndex:
+    """Key -> value map shared by all worker processes of a run.
+
+    Each process appends to its own JSONL file (like the journal) and picks up
+    other workers' entries on a miss, reading only what was appended since.
+    """
+
+    def __init__(self, directory, ttl=None):
+        self.directory = directory
+        self.ttl = ttl
+        self.values = {}
+        self._offsets = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def refresh(self):
+        now = time.time()
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".jsonl"):
+                continue
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                f.seek(self._offsets.get(name, 0))
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # Still being written; read it on the next refresh
+                        break
+                    self._offsets[name] = self._offsets.get(name, 0) + len(line)
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if self.ttl is None or now - entry['ts'] <= self.ttl:
+                        self.values[entry['key']] = entry['records']
+
+    def get(self, key):
+        if key not in self.values:
+            self.refresh()
+        return self.values.get(key)
+
+    def put(self, key, value, persist=True):
+        self.values[key] = value
+        if persist:
+            _append_entry(self.directory, key, value)
+
+
+class ProductIndex:
+    """Splits a site's rows into one products table and one category-membership table.
+
+    A product found in many categories is stored once under its product key; the
+    membership table links each key to every category it was listed in. Membership
+    rows go to disk with every add(), so only the products stay in memory.
+    Written to result/<site>_dedupe/products.<fmt> and membership/part-*.<fmt>.
+    """
+
+    def __init__(self, site, result_dir, fmt=None):
+        self.site = site
+        self.fmt = fmt or OUTPUT_FORMAT
+        if self.fmt == 'parquet' and pq is None:
+            self.fmt = 'csv'
+        self.product_columns = PRODUCT_COLUMNS[site]
+        self.root = os.path.join(result_dir, f"{site}_dedupe")
+        if os.path.isdir(self.root):
+            shutil.rmtree(self.root)
+        os.makedirs(os.path.join(self.root, "membership"), exist_ok=True)
+        self.products = {}
+        self.membership_parts = 0
+        self.membership_rows = 0
+
+    def add(self, result):
+        records = result.to_dict('records') if isinstance(result, pd.DataFrame) else list(result)
+        membership = []
+        for record in records:
+            record = clean_record(record)
+            key = product_key(self.site, record)
+            if key is None:
+                continue
+            product = self.products.get(key)
+            if product is None:
+                self.products[key] = {'Product Key': key, **{c: record.get(c) for c in self.product_columns}}
+            else:
+                # Later listings only fill in what earlier ones were missing
+                for column in self.product_columns:
+                    if not product.get(column) and record.get(column):
+                        product[column] = record[column]
+            membership.append({'Product Key': key, **{c: v for c, v in record.items()
+                                                      if c not in self.product_columns}})
+        if membership:
+            self._write(os.path.join("membership", f"part-{self.membership_parts:05d}"), membership)
+            self.membership_parts += 1
+            self.membership_rows += len(membership)
+
+    def _write(self, name, records):
+        path = os.path.join(self.root, f"{name}.{self.fmt}")
+        if self.fmt == 'parquet':
+            columns = list(dict.fromkeys(c for record in records for c in record))
+            schema = pa.schema([(column, pa.string()) for column in columns])
+            pq.write_table(pa.Table.from_pylist(records, schema=schema), path, compression='snappy')
+        else:
+            pd.DataFrame(records).to_csv(path, index=False)
+        return path
+
+    def write(self):
+        self._write("products", list(self.products.values()))
+        print(f"Deduplicated {self.membership_rows} {self.site} rows into {len(self.products)} products "
+              f"({self.root})")
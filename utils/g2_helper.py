@@ -6,6 +6,13 @@ import re
 import time
 import requests
 from seleniumbase import SB
+from utils.browser_pool import BrowserPool, borrow_browser
+from utils.parsing import parse_page
+from utils.page_cache import fetch_page
+from utils.checkpoint import DELTA
+from utils.scheduler import UNCHANGED, FanOut, note_pages, should_fan_out, unchanged_since_last_run
+from utils.hybrid_fetch import HybridFetcher
+from utils.stage_timing import stage
 import multiprocessing
 import numpy as np
 
@@ -40,60 +47,95 @@ def get_with_retries(scraper, url, headers, retries=2, delay=5):
                 print(f"All retries failed for {url}.")
                 raise  # Re-raise the last exception if all retries fail
 
-def extract_categories(table):
-    categories = []
-    rows = table.select('tbody tr')
-    # Get top-level category from thead
-    category_1_tag = table.select_one('thead tr td.l3')
-    category_1 = category_1_tag.get_text(strip=True) if category_1_tag else None
-
-    # Build lookup for name -> (parent, link)
-    name_to_parent = {}
-    name_to_link = {}
-    for row in rows:
-        name_tag = row.select_one('.categories__name a')
-        parent_div = row.select_one('.categories__parent')
-        if name_tag:
+class CategoryNode:
+    __slots__ = ('name', 'link', 'parent', 'children', '_path')
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.link = None
+        self.parent = parent
+        self.children = []
+        self._path = None
+
+    def path(self):
+        """[(name, link)] from the top-level category down to this one; computed once."""
+        if self._path is None:
+            prefix = self.parent.path() if self.parent is not None else []
+            self._path = prefix + [(self.name, self.link)]
+        return self._path
+
+
+class CategoryTree:
+    """G2's category hierarchy as a trie indexed by parent, built in one pass over /categories.
+
+    Each table is one top-level category; its rows name a category and its parent.
+    Leaves (and level-4 categories, the deepest kept) are the rows to scrape.
+    """
+
+    MAX_DEPTH = 4
+
+    def __init__(self):
+        self.roots = []
+        self._rows = []
+
+    @classmethod
+    def from_tables(cls, tables):
+        tree = cls()
+        for table in tables:
+            tree.add_table(table)
+        return tree
+
+    def add_table(self, table):
+        category_1_tag = table.select_one('thead tr td.l3')
+        root = CategoryNode(category_1_tag.get_text(strip=True) if category_1_tag else None)
+        self.roots.append(root)
+        # A row may name its parent before the parent's own row, so nodes are made on first mention
+        nodes = {root.name: root}
+        pending = []
+        for row in table.select('tbody tr'):
+            name_tag = row.select_one('.categories__name a')
+            if not name_tag:
+                continue
+            parent_div = row.select_one('.categories__parent')
             name = name_tag.get_text(strip=True)
-            link = "https://www.g2.com" + name_tag.get('href')
-            parent = parent_div.get_text(strip=True) if parent_div else None
-            name_to_parent[name] = parent
-            name_to_link[name] = link
-
-    for row in rows:
-        name_tag = row.select_one('.categories__name a')
-        if name_tag:
-            current = name_tag.get_text(strip=True)
-            current_link = name_to_link.get(current)
-            # Build the full chain from current up to top-level
-            chain = []
-            links = []
-            node = current
-            while node and node != category_1:
-                chain.append(node)
-                links.append(name_to_link.get(node))
-                node = name_to_parent.get(node)
-            # Add top-level
-            chain.append(category_1)
-            links.append(None)
-            # Reverse so left is top-level, right is deepest
-            chain = chain[::-1]
-            links = links[::-1]
-            # Pad to 4 levels
-            while len(chain) < 5:
-                chain.append(None)
-                links.append(None)
-            categories.append({
-                'category_1': chain[0],
-                'category_1_link': links[0],
-                'category_2': chain[1],
-                'category_2_link': links[1],
-                'category_3': chain[2],
-                'category_3_link': links[2],
-                'category_4': chain[3],
-                'category_4_link': links[3]
-            })
-    return categories
+            node = nodes.get(name) or nodes.setdefault(name, CategoryNode(name))
+            node.link = "https://www.g2.com" + name_tag.get('href')
+            pending.append((node, parent_div.get_text(strip=True) if parent_div else None))
+            self._rows.append(node)
+        for node, parent_name in pending:
+            if node is root or node.parent is not None:
+                continue
+            parent = root
+            if parent_name and parent_name != root.name:
+                parent = nodes.get(parent_name)
+                if parent is None:
+                    # Named as a parent but without a row of its own: a link-less level under the top
+                    parent = nodes[parent_name] = CategoryNode(parent_name, root)
+                    root.children.append(parent)
+                ancestor = parent
+                while ancestor is not None and ancestor is not node:
+                    ancestor = ancestor.parent
+                if ancestor is node:
+                    parent = root
+            node.parent = parent
+            parent.children.append(node)
+        # The top-level category itself has no link of its own on this page
+        root.link = None
+
+    def leaves(self):
+        """One row per category to scrape, in page order, with its deepest link."""
+        for node in self._rows:
+            path = node.path()
+            if node.children and len(path) < self.MAX_DEPTH:
+                continue
+            path = path[:self.MAX_DEPTH] + [(None, None)] * (self.MAX_DEPTH - len(path))
+            row = {}
+            for level, (name, link) in enumerate(path, start=1):
+                row[f'category_{level}'] = name
+                row[f'category_{level}_link'] = link
+            row['last_category_link'] = next((link for _, link in reversed(path) if link), None)
+            yield row
+
 
 def get_product_table(product_div):
     product_name = product_div.select_one("div[class *= 'product-name']").get_text(strip=True)
@@ -109,14 +151,30 @@ def get_product_table(product_div):
     }
 
 
+SB_OPTIONS = dict(uc=True, headless=False, maximize=True)
+
+
+def scrape_page(fetcher, paged_url):
+    html = fetcher.get_html(paged_url)
+    soup = parse_page(html, 'g2')
+    raw_product_divs = soup.select("div[data-ordered-events-item*='product']")
+    with stage('records', 'g2'):
+        return [get_product_table(div) for div in raw_product_divs]
+
+
+def scrape_category_page(row, paged_url, info):
+    """Fan-out task: one pagination page of a large category, on any free worker."""
+    print("Scraping page:", paged_url)
+    with borrow_browser(**SB_OPTIONS) as sb:
+        return [{**info, **product} for product in scrape_page(HybridFetcher(sb, 'g2'), paged_url)]
+
+
 def scrape_categories(row):
-    with SB(uc=True, headless=False, maximize=True) as sb:
+    with borrow_browser(**SB_OPTIONS) as sb:
         link = row['last_category_link']
         print("Scraping:", link)
-        sb.uc_open(link)
-        sb.sleep(5)
-        html = sb.get_page_source()
-        soup = BeautifulSoup(html, 'html.parser')
+        html = fetch_page(sb, link, 'g2', reuse=not DELTA)
+        soup = parse_page(html, 'g2')
 
         raw_pagination = soup.select_one("ul[aria-label *= 'Pagination']")
         li_elements = raw_pagination.find_all('li') if raw_pagination else []
@@ -131,6 +189,7 @@ def scrape_categories(row):
             print(f"Pagination extraction failed: {e}")
             last_href = link
             page_number = 1
+        note_pages(page_number)
 
         info = {'Category 1': row['category_1'],
                 'Category 2': row['category_2'],
@@ -139,18 +198,21 @@ def scrape_categories(row):
                 'Last Category Link': last_href}
 
         raw_product_divs = soup.select("div[data-ordered-events-item*='product']")
-        result = [get_product_table(div) for div in raw_product_divs]
-
-        for i in range(2, page_number+1):
-            paged_url = f"{link}?order=g2_score&page={i}"
+        with stage('records', 'g2'):
+            result = [get_product_table(div) for div in raw_product_divs]
+        if unchanged_since_last_run(page_number, result):
+            print(f"{link} unchanged since the last run")
+            return UNCHANGED
+
+        paged_urls = [f"{link}?order=g2_score&page={i}" for i in range(2, page_number+1)]
+        if should_fan_out(paged_urls):
+            return FanOut([{**info, **product} for product in result], paged_urls,
+                          scrape_category_page, context=info)
+        fetcher = HybridFetcher(sb, 'g2') if paged_urls else None
+        for paged_url in paged_urls:
             print("Scraping page:", paged_url)
-            sb.uc_open(paged_url)
-            sb.sleep(5)
-            html = sb.get_page_source()
-            soup = BeautifulSoup(html, 'html.parser')
-            raw_product_divs = soup.select("div[data-ordered-events-item*='product']")
-            result.extend([get_product_table(div) for div in raw_product_divs])
+            result.extend(scrape_page(fetcher, paged_url))
 
         combined = [{**info, **product} for product in result]
         result_df = pd.DataFrame(combined)
-        return result_df
\ No newline at end of file
+        return result_df
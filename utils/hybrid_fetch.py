@@ -0,0 +1,181 @@
+import os
+import time
+
+from curl_cffi import requests as curl_requests
+
+from utils import page_cache, proxy_pool, rate_limit, resource_blocking
+from utils.browser_pool import register_worker_stats
+from utils.page_wait import wait_for_page
+from utils.stage_timing import stage
+
+# Set HYBRID_FETCH=0 to render every pagination page in the browser again
+HYBRID_FETCH = os.environ.get('HYBRID_FETCH', '1') != '0'
+
+CHALLENGE_STATUS_CODES = {403, 429, 503}
+CHALLENGE_MARKERS = [
+    'Just a moment...',
+    'cf-chl-',
+    'cf_chl_opt',
+    'challenge-platform',
+    'Attention Required! | Cloudflare',
+    'cf-turnstile',
+]
+
+_http_session = None
+_totals = {'http': 0, 'browser': 0, 'challenges': 0, 'no_products': 0}
+
+
+def get_http_session(impersonate='chrome'):
+    """One curl_cffi session per worker process so TLS connections are reused across categories."""
+    global _http_session
+    if _http_session is None:
+        _http_session = curl_requests.Session(impersonate=impersonate)
+    return _http_session
+
+
+def looks_like_challenge(status_code, html):
+    if status_code in CHALLENGE_STATUS_CODES:
+        return True
+    head = html[:20000]
+    return any(marker in head for marker in CHALLENGE_MARKERS)
+
+
+class HybridFetcher:
+    """Fetches pagination pages over HTTP with the cookies the browser earned on page 1.
+
+    Falls back to rendering in the browser (and re-syncing cookies) whenever the
+    HTTP response looks like a Cloudflare challenge or keeps failing.
+    """
+
+    def __init__(self, sb, site, proxy=None, open_page=None, retries=1, delay=5, timeout=30):
+        self.sb = sb
+        self.site = site
+        # open_page(sb, url) loads url in the browser; returns False on failure
+        self.open_page = open_page or self._open_page
+        self.retries = retries
+        self.delay = delay
+        self.timeout = timeout
+        self.proxy = proxy
+        self.proxies = {'http': f"http://{proxy}", 'https': f"http://{proxy}"} if proxy else None
+        self.session = get_http_session()
+        self.headers = {}
+        self.stats = {'http': 0, 'browser': 0, 'challenges': 0, 'no_products': 0}
+        if not page_cache.REPLAY:
+            self.sync_from_browser()
+
+    def _count(self, key):
+        self.stats[key] += 1
+        _totals[key] += 1
+
+    def sync_from_browser(self):
+        """Copies the browser's cookies and user agent into the HTTP session."""
+        self.session.cookies.clear()
+        for cookie in self.sb.driver.get_cookies():
+            self.session.cookies.set(
+                cookie['name'], cookie['value'],
+                domain=cookie.get('domain', ''), path=cookie.get('path', '/'),
+            )
+        user_agent = self.sb.execute_script("return navigator.userAgent;")
+        self.headers = {
+            'user-agent': user_agent,
+            'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'accept-language': 'en-US,en;q=0.9',
+            'referer': self.sb.get_current_url(),
+        }
+
+    def get_html_over_http(self, url):
+        """Returns the page HTML, or None if the request failed, hit a challenge or has no products.
+
+        A 200 without the site's product marker is usually a page that renders its
+        cards in JS, so it goes to the browser rather than parsing to zero rows.
+        """
+        for attempt in range(self.retries + 1):
+            rate_limit.acquire(self.site)
+            started = time.perf_counter()
+            try:
+                with stage('http', self.site):
+                    response = self.session.get(url.replace(' ', '%20'), headers=self.headers, proxies=self.proxies,
+                                                timeout=self.timeout)
+                # listing=False: a page without product cards over HTTP may just need JS, not be a block
+                if rate_limit.page_outcome(self.site, response.text, response.status_code, listing=False):
+                    print(f"Challenge detected over HTTP for {url}")
+                    self._count('challenges')
+                    proxy_pool.record(self.proxy, False)
+                    return None
+                response.raise_for_status()
+                proxy_pool.record(self.proxy, True, time.perf_counter() - started)
+                marker = rate_limit.PRODUCT_MARKERS.get(self.site)
+                if marker and marker not in response.text:
+                    print(f"No products in the HTTP response for {url}")
+                    self._count('no_products')
+                    return None
+                return response.text
+            except curl_requests.exceptions.RequestException as e:
+                print(f"Request to {url} failed on attempt {attempt + 1}: {e}")
+                proxy_pool.record(self.proxy, False)
+                if attempt < self.retries:
+                    print(f"Retrying in {self.delay} seconds...")
+                    time.sleep(self.delay)
+        return None
+
+    def _open_page(self, sb, url):
+        with stage('open', self.site):
+            sb.uc_open(url)
+        wait_for_page(sb, self.site)
+
+    def get_html_in_browser(self, url):
+        rate_limit.acquire(self.site)
+        blocking = resource_blocking.before_load(self.sb, self.site)
+        started = time.perf_counter()
+        if self.open_page(self.sb, url) is False:
+            rate_limit.report(self.site, blocked=True)
+            proxy_pool.record(self.proxy, False)
+            raise RuntimeError(f"Failed to load {url} in the browser")
+        self._count('browser')
+        with stage('page_source', self.site):
+            html = self.sb.get_page_source()
+        seconds = time.perf_counter() - started
+        blocked = rate_limit.page_outcome(self.site, html)
+        proxy_pool.record(self.proxy, not blocked, seconds)
+        resource_blocking.after_load(self.sb, self.site, blocking, seconds, html)
+        return html
+
+    def get_html(self, url):
+        cached = page_cache.get(url)
+        if cached is not None or page_cache.REPLAY:
+            return cached or ''
+        if HYBRID_FETCH:
+            html = self.get_html_over_http(url)
+            if html is not None:
+                self._count('http')
+                page_cache.put(url, html)
+                return html
+            print(f"Falling back to browser for {url}")
+        html = self.get_html_in_browser(url)
+        page_cache.put(url, html)
+        if HYBRID_FETCH:
+            # The browser may have just cleared a fresh challenge; reuse its cookies
+            self.sync_from_browser()
+        return html
+
+
+def snapshot():
+    return dict(_totals)
+
+
+def reset():
+    for key in _totals:
+        _totals[key] = 0
+
+
+def print_fetch_report(snapshots):
+    totals = {key: sum(s.get(key, 0) for s in snapshots) for key in _totals}
+    pages = totals['http'] + totals['browser']
+    if pages:
+        print(f"Hybrid fetch: {totals['http']}/{pages} pagination pages over HTTP, "
+              f"{totals['browser']} in the browser, {totals['challenges']} challenges hit, "
+              f"{totals['no_products']} HTTP pages without products")
+    return totals
+
+
+register_worker_stats('hybrid_fetch', snapshot, print_fetch_report, reset)
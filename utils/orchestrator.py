@@ -0,0 +1,72 @@
+import os
+
+from utils.browser_pool import BrowserPool
+from utils.checkpoint import CategoryJournal
+from utils.scheduler import CategoryScheduler, run_sites
+from utils.stream_writer import StreamWriter
+
+
+def parse_limits(text):
+    """"capterra=4,getapp=2" -> {'capterra': 4, 'getapp': 2}"""
+    limits = {}
+    for item in (text or '').split(','):
+        if '=' in item:
+            site, value = item.split('=', 1)
+            limits[site.strip()] = int(value)
+    return limits
+
+
+# Overrides for the per-site caps, e.g. SITE_LIMITS="capterra=4,getapp=2"
+SITE_LIMITS = parse_limits(os.environ.get('SITE_LIMITS'))
+
+
+class SiteAdapter:
+    """One site for the orchestrator, built from that site's own scraper functions.
+
+    discover() returns the category rows and scrape_category(row) is the pool task;
+    category_label(row) names the category's output partition. max_concurrency caps
+    the site's tasks in flight when it shares a pool with other sites. on_part and
+    export(sink) are the site's optional per-part and end-of-run exports.
+    """
+
+    def __init__(self, site, discover, scrape_category, key_field, category_label, max_concurrency,
+                 n_parts=1, on_part=None, as_frame=True, export=None):
+        self.site = site
+        self.discover = discover
+        self.scrape_category = scrape_category
+        self.key_field = key_field
+        self.category_label = category_label
+        self.max_concurrency = max_concurrency
+        self.n_parts = n_parts
+        self.on_part = on_part
+        self.as_frame = as_frame
+        self.export = export
+
+    def start(self, result_dir):
+        rows = self.discover()
+        print(f"[{self.site}] {len(rows)} categories to scrape")
+        self.journal = CategoryJournal(self.site, result_dir)
+        scheduler = CategoryScheduler(self.site, result_dir, self.journal)
+        return scheduler.start(self.scrape_category, rows, self.key_field, self.category_label,
+                               n_parts=self.n_parts, on_part=self.on_part, as_frame=self.as_frame)
+
+    def finish(self, sink):
+        print(f"Wrote {sink.rows_written} {self.site} rows to {sink.root}")
+        if self.export is not None:
+            self.export(sink)
+
+
+def crawl(adapters, processes, result_dir, limits=None, max_sessions=1):
+    """Discovers each site's categories, then scrapes all of them over one BrowserPool.
+
+    Each site stays within its max_concurrency (or limits[site]) while the pool as a
+    whole stays busy. max_sessions > 1 lets a worker keep a browser per site.
+    Records go from the workers straight to one StreamWriter process.
+    """
+    limits = {**{adapter.site: adapter.max_concurrency for adapter in adapters}, **SITE_LIMITS, **(limits or {})}
+    with StreamWriter(result_dir, [adapter.site for adapter in adapters]) as writer:
+        runs = [adapter.start(result_dir) for adapter in adapters]
+        with BrowserPool(processes=processes, max_sessions=max_sessions, record_queue=writer.queue) as pool:
+            run_sites(pool, runs, limits)
+    for adapter in adapters:
+        adapter.finish(writer.sinks[adapter.site])
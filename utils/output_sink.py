@@ -0,0 +1,133 @@
+import hashlib
+import os
+import re
+import shutil
+import sys
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# parquet (default, needs pyarrow) | csv
+OUTPUT_FORMAT = os.environ.get('OUTPUT_FORMAT', 'parquet')
+# `python scrape_x.py --excel` also writes the old whole-run .xlsx files
+EXPORT_EXCEL = '--excel' in sys.argv or os.environ.get('EXPORT_EXCEL') == '1'
+
+# Same characters clean_illegal_chars strips; openpyxl rejects them
+ILLEGAL_CHARS = re.compile(r'[\x00-\x1F\x7F-\x9F]')
+
+
+def clean_value(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and value != value:
+        return None
+    return ILLEGAL_CHARS.sub('', str(value))
+
+
+def clean_record(record):
+    return {key: clean_value(value) for key, value in record.items()}
+
+
+def partition_name(category):
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', str(category)).strip('-')[:60] or 'unknown'
+    digest = hashlib.sha1(str(category).encode('utf-8')).hexdigest()[:8]
+    return f"category={slug}-{digest}"
+
+
+class RecordSink:
+    """Streams records to result/<site>/category=<...>/ as each category arrives.
+
+    Values are cleaned like clean_illegal_chars and stored as strings, so every
+    partition shares one schema. Only one category is held in memory at a time.
+    """
+
+    def __init__(self, site, result_dir, fmt=None, row_group_size=10000):
+        self.site = site
+        self.fmt = fmt or OUTPUT_FORMAT
+        if self.fmt == 'parquet' and pq is None:
+            print("pyarrow is not installed, writing CSV partitions instead")
+            self.fmt = 'csv'
+        self.row_group_size = row_group_size
+        self.root = os.path.join(result_dir, site)
+        # Always rebuilt from scratch: on --resume the journal replays finished categories
+        if os.path.isdir(self.root):
+            shutil.rmtree(self.root)
+        os.makedirs(self.root, exist_ok=True)
+        self.files = []
+        self.columns = []
+        self.rows_written = 0
+
+    def state(self):
+        return {'fmt': self.fmt, 'row_group_size': self.row_group_size, 'root': self.root,
+                'files': self.files, 'columns': self.columns, 'rows_written': self.rows_written}
+
+    @classmethod
+    def from_state(cls, site, state):
+        """The sink as written by another process (see StreamWriter), for the exports."""
+        sink = cls.__new__(cls)
+        sink.site = site
+        sink.__dict__.update(state)
+        return sink
+
+    def write(self, category, result, order=None):
+        """Writes one category; order sets its position in the exports (default: arrival)."""
+        records = result.to_dict('records') if isinstance(result, pd.DataFrame) else list(result)
+        if not records:
+            return
+        records = [clean_record(record) for record in records]
+        for key in records[0]:
+            if key not in self.columns:
+                self.columns.append(key)
+
+        partition_dir = os.path.join(self.root, partition_name(category))
+        os.makedirs(partition_dir, exist_ok=True)
+        path = os.path.join(partition_dir, f"part-{len(self.files):05d}.{self.fmt}")
+        if self.fmt == 'parquet':
+            self._write_parquet(path, records)
+        else:
+            pd.DataFrame(records).to_csv(path, index=False)
+        self.files.append((len(self.files) if order is None else order, path))
+        self.rows_written += len(records)
+
+    def _write_parquet(self, path, records):
+        columns = list(records[0])
+        schema = pa.schema([(column, pa.string()) for column in columns])
+        with pq.ParquetWriter(path, schema, compression='snappy') as writer:
+            for start in range(0, len(records), self.row_group_size):
+                chunk = records[start:start + self.row_group_size]
+                table = pa.Table.from_pylist(chunk, schema=schema)
+                writer.write_table(table)
+
+    def _read(self, path):
+        if path.endswith('.parquet'):
+            return pd.read_parquet(path)
+        return pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[''])
+
+    def iter_frames(self):
+        """Yields each written partition file as a DataFrame, in export order."""
+        for _, path in sorted(self.files, key=lambda item: item[0]):
+            yield self._read(path).reindex(columns=self.columns)
+
+    def export_csv(self, path):
+        """Concatenates all partitions into one CSV, one partition in memory at a time."""
+        header = True
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            for frame in self.iter_frames():
+                frame.to_csv(f, index=False, header=header)
+                header = False
+            if header:
+                pd.DataFrame(columns=self.columns).to_csv(f, index=False)
+        print(f"Exported {self.rows_written} {self.site} rows to {path}")
+
+    def export_excel(self, path):
+        """Optional end-of-run .xlsx export; unlike the partitions this loads every row."""
+        frames = list(self.iter_frames())
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=self.columns)
+        df.to_excel(path, index=False)
+        print(f"Exported {len(df)} {self.site} rows to {path}")
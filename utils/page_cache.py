@@ -0,0 +1,176 @@
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+
+script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CACHE_DIR = os.environ.get('PAGE_CACHE_DIR', os.path.join(script_dir, "cache", "pages"))
+CACHE_TTL = float(os.environ.get('PAGE_CACHE_TTL', 7 * 24 * 3600))
+CACHE_MAX_BYTES = int(float(os.environ.get('PAGE_CACHE_MAX_MB', 2048)) * 1024 * 1024)
+# Set PAGE_CACHE=0 to neither read nor write the cache on live runs
+CACHE_ENABLED = os.environ.get('PAGE_CACHE', '1') != '0'
+# `python scrape_x.py --replay` re-runs the whole pipeline from the cache, no network
+REPLAY = '--replay' in sys.argv or os.environ.get('SCRAPER_REPLAY') == '1'
+
+EVICT_EVERY = 200
+
+_puts_since_evict = 0
+
+
+def cache_key(url, params=None):
+    payload = json.dumps({'url': url, 'params': params or {}}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def cache_path(key):
+    return os.path.join(CACHE_DIR, key[:2], key + ".html.gz")
+
+
+def get(url, params=None, ttl=None):
+    """Returns the cached HTML for url, or None if missing or older than ttl.
+
+    In replay mode entries never expire.
+    """
+    if not (CACHE_ENABLED or REPLAY):
+        return None
+    path = cache_path(cache_key(url, params))
+    try:
+        age = time.time() - os.path.getmtime(path)
+        if not REPLAY and age > (CACHE_TTL if ttl is None else ttl):
+            return None
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return f.read()
+    except (OSError, EOFError):
+        return None
+
+
+def put(url, html, params=None):
+    global _puts_since_evict
+    if not CACHE_ENABLED or REPLAY or not html:
+        return
+    path = cache_path(cache_key(url, params))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+        f.write(html)
+    os.replace(tmp_path, path)
+    _puts_since_evict += 1
+    if _puts_since_evict >= EVICT_EVERY:
+        _puts_since_evict = 0
+        evict()
+
+
+def evict(max_bytes=None):
+    """Deletes expired entries, then the oldest ones until the cache fits in max_bytes."""
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    now = time.time()
+    for root, _, files in os.walk(CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if now - stat.st_mtime > CACHE_TTL:
+                _remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        _remove(path)
+        total -= size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def fetch_page(sb, url, site, open_page=None, params=None, reuse=True, listing=True, proxy=None):
+    """Returns the page HTML from the cache, or loads it in the browser and caches it.
+
+    open_page(sb, url) navigates and waits; returning False means the load failed,
+    in which case None is returned. reuse=False still records the page but always
+    loads it live, for callers that go on to interact with the rendered page.
+    Live loads go through the site's rate limiter; listing=False marks pages that
+    have no product cards, so an empty page is not taken as a block. proxy is the
+    one sb was started with, so the load is scored against it.
+    """
+    if REPLAY or reuse:
+        html = get(url, params)
+        if html is not None:
+            return html
+        if REPLAY:
+            print(f"Replay: no cached page for {url}")
+            return ''
+    from utils import proxy_pool, rate_limit, resource_blocking
+    from utils.stage_timing import stage
+    rate_limit.acquire(site)
+    blocking = resource_blocking.before_load(sb, site)
+    started = time.perf_counter()
+    if open_page is None:
+        from utils.page_wait import wait_for_page
+        with stage('open', site):
+            sb.uc_open(url)
+        wait_for_page(sb, site)
+    elif open_page(sb, url) is False:
+        rate_limit.report(site, blocked=True)
+        proxy_pool.record(proxy, False)
+        return None
+    with stage('page_source', site):
+        html = sb.get_page_source()
+    seconds = time.perf_counter() - started
+    blocked = rate_limit.page_outcome(site, html, listing=listing)
+    proxy_pool.record(proxy, not blocked, seconds)
+    resource_blocking.after_load(sb, site, blocking, seconds, html)
+    put(url, html, params)
+    return html
+
+
+class _NoOp:
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class _ReplayDriver(_NoOp):
+    window_handles = ['replay']
+    current_url = ''
+
+    def get_cookies(self):
+        return []
+
+
+class ReplayBrowser(_NoOp):
+    """Stands in for an SB session in replay mode; every page comes from the cache."""
+
+    def __init__(self):
+        self.driver = _ReplayDriver()
+        self._url = ''
+
+    def _open(self, url, *args, **kwargs):
+        self._url = url
+
+    uc_open = uc_open_with_reconnect = open = activate_cdp_mode = _open
+
+    def get_current_url(self):
+        return self._url
+
+    def get_page_source(self):
+        return get(self._url) or ''
+
+    def is_element_present(self, selector):
+        return True
+
+    def execute_script(self, script, *args):
+        return True
+
+    def click(self, selector, *args, **kwargs):
+        raise RuntimeError("Replay mode cannot click on cached pages")
@@ -0,0 +1,173 @@
+import time
+
+from utils.browser_pool import register_worker_stats
+from utils.stage_timing import record_stage
+
+# Element that only exists once a listing page has rendered its products
+READY_SELECTORS = {
+    'capterra': "div[id*='product-card-container']",
+    'getapp': 'div[data-evt-name*="product"]',
+    'shi': 'div.row.srProduct',
+    'g2': "div[data-ordered-events-item*='product']",
+}
+
+# Fixed sleeps the scrapers used before, to estimate how much time waits give back
+FIXED_SLEEPS = {
+    'capterra': 5,
+    'getapp': 7,
+    'shi': 7,
+    'g2': 5,
+}
+
+HISTOGRAM_BUCKETS = [0.5, 1, 2, 3, 5, 7, 10, 15, 30]
+
+# Counts fetch/XHR requests still in flight. Installed with
+# Page.addScriptToEvaluateOnNewDocument, so it runs before the page's own scripts
+# and sees every request; requests already in flight on an older page are not counted.
+TRACK_REQUESTS_JS = """
+(function () {
+    if (window.__pendingRequests !== undefined) { return; }
+    window.__pendingRequests = 0;
+    var done = function () { window.__pendingRequests = Math.max(0, window.__pendingRequests - 1); };
+    if (window.fetch) {
+        var fetch = window.fetch;
+        window.fetch = function () {
+            window.__pendingRequests++;
+            return fetch.apply(this, arguments).then(function (r) { done(); return r; },
+                                                     function (e) { done(); throw e; });
+        };
+        window.fetch.toString = function () { return fetch.toString(); };
+    }
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        window.__pendingRequests++;
+        this.addEventListener('loadend', done);
+        return send.apply(this, arguments);
+    };
+})();
+"""
+
+# Resource timing entries are only added once a request finishes, so idle also needs
+# no fetch/XHR in flight (client-rendered cards arrive that way) before "no entry for
+# quiet_ms" after readyState=complete counts. Pages loaded before the tracker was
+# installed never count as idle; they wait for the selector (or the timeout).
+NETWORK_IDLE_JS = """
+if (document.readyState !== 'complete') { return false; }
+if (window.__pendingRequests === undefined || window.__pendingRequests > 0) { return false; }
+var entries = performance.getEntriesByType('resource');
+var last = 0;
+for (var i = 0; i < entries.length; i++) {
+    if (entries[i].responseEnd > last) { last = entries[i].responseEnd; }
+}
+return (performance.now() - last) > arguments[0];
+"""
+
+_tracked_drivers = set()
+_histograms = {}
+
+
+def _new_histogram():
+    return {'buckets': [0] * (len(HISTOGRAM_BUCKETS) + 1), 'count': 0, 'sum': 0.0, 'timeouts': 0}
+
+
+def record_wait(site, seconds, timed_out=False):
+    hist = _histograms.setdefault(site, _new_histogram())
+    for i, bound in enumerate(HISTOGRAM_BUCKETS):
+        if seconds <= bound:
+            hist['buckets'][i] += 1
+            break
+    else:
+        hist['buckets'][-1] += 1
+    hist['count'] += 1
+    hist['sum'] += seconds
+    if timed_out:
+        hist['timeouts'] += 1
+
+
+def track_requests(sb):
+    """Installs TRACK_REQUESTS_JS for every page this browser loads from now on."""
+    # session_id too: a recycled browser's driver object may reuse the old id()
+    key = id(sb.driver), getattr(sb.driver, 'session_id', None)
+    if key in _tracked_drivers:
+        return
+    _tracked_drivers.add(key)
+    try:
+        sb.driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": TRACK_REQUESTS_JS})
+    except Exception as e:
+        print(f"Could not install the request tracker, waiting on selectors only: {e}")
+
+
+def is_network_idle(sb, quiet_ms=500):
+    try:
+        return bool(sb.execute_script(NETWORK_IDLE_JS, quiet_ms))
+    except Exception:
+        return False
+
+
+def wait_for_page(sb, site, selector=None, timeout=15, poll=0.25, quiet_ms=500):
+    """Waits until the site's product cards are present or the network goes idle.
+
+    The selector is checked first on every poll; idle only ends the wait for pages
+    that really have no cards. Returns the number of seconds waited. Hitting the
+    timeout is not an error: the caller parses whatever has rendered, just as after
+    the old fixed sleep.
+    """
+    selector = selector or READY_SELECTORS[site]
+    track_requests(sb)
+    started = time.perf_counter()
+    deadline = started + timeout
+    timed_out = True
+    while time.perf_counter() < deadline:
+        try:
+            if sb.is_element_present(selector):
+                timed_out = False
+                break
+        except Exception:
+            pass
+        if is_network_idle(sb, quiet_ms):
+            timed_out = False
+            break
+        time.sleep(poll)
+    elapsed = time.perf_counter() - started
+    record_wait(site, elapsed, timed_out)
+    record_stage('wait', elapsed, site)
+    if timed_out:
+        print(f"Page not ready after {timeout}s ({site}), continuing anyway")
+    return elapsed
+
+
+def snapshot():
+    return {site: dict(hist, buckets=list(hist['buckets'])) for site, hist in _histograms.items()}
+
+
+def reset():
+    _histograms.clear()
+
+
+def merge_histograms(snapshots):
+    merged = {}
+    for snap in snapshots:
+        for site, hist in snap.items():
+            target = merged.setdefault(site, _new_histogram())
+            target['buckets'] = [a + b for a, b in zip(target['buckets'], hist['buckets'])]
+            target['count'] += hist['count']
+            target['sum'] += hist['sum']
+            target['timeouts'] += hist['timeouts']
+    return merged
+
+
+def print_wait_report(snapshots):
+    merged = merge_histograms(snapshots)
+    labels = [f"<={b}s" for b in HISTOGRAM_BUCKETS] + [f">{HISTOGRAM_BUCKETS[-1]}s"]
+    for site, hist in merged.items():
+        if not hist['count']:
+            continue
+        fixed_total = FIXED_SLEEPS.get(site, 0) * hist['count']
+        print(f"Page waits [{site}]: {hist['count']} pages, {hist['sum']:.1f}s waited, "
+              f"avg {hist['sum'] / hist['count']:.2f}s, {hist['timeouts']} timeouts, "
+              f"{fixed_total - hist['sum']:.1f}s saved vs fixed sleeps")
+        print("    " + "  ".join(f"{label}: {n}" for label, n in zip(labels, hist['buckets']) if n))
+    return merged
+
+
+register_worker_stats('page_wait', snapshot, print_wait_report, reset)
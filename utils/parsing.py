@@ -0,0 +1,120 @@
+import os
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from utils.stage_timing import stage
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    HTMLParser = None
+
+# lxml (default) | selectolax | html.parser (the old, slow behaviour)
+HTML_PARSER = os.environ.get('HTML_PARSER', 'lxml')
+
+# The parts of a listing page the scrapers read: product containers and pagination.
+# Each rule is (tag, attribute, substring), mirroring the CSS `tag[attr*=value]`
+# selectors used in scrape_tables / get_product_overview / get_product_table.
+PAGE_REGIONS = {
+    'capterra': [
+        ('div', 'id', 'product-card-container'),
+        ('div', 'data-test-id', 'current-page-display'),
+    ],
+    'getapp': [
+        ('div', 'data-evt-name', 'product'),
+        ('div', 'class', 'Pagination'),
+    ],
+    'shi': [
+        ('div', 'id', 'srResultsDiv'),
+        ('div', 'class', 'searchPages'),
+    ],
+    'g2': [
+        ('div', 'data-ordered-events-item', 'product'),
+        ('ul', 'aria-label', 'Pagination'),
+    ],
+}
+
+
+def _attr_text(value):
+    if isinstance(value, (list, tuple)):
+        return ' '.join(value)
+    return value or ''
+
+
+class RegionStrainer(SoupStrainer):
+    """SoupStrainer that keeps every tag matching any (tag, attribute, substring) rule.
+
+    A plain SoupStrainer ANDs its attribute rules; here they are ORed so that the
+    product list and the pagination widget survive the same partial parse.
+    """
+
+    def __init__(self, rules):
+        super().__init__()
+        self.rules = rules
+
+    @property
+    def includes_everything(self):
+        return False
+
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        if not attrs:
+            return False
+        for tag, attr, value in self.rules:
+            if name == tag and value in _attr_text(attrs.get(attr)):
+                return True
+        return False
+
+    def allow_string_creation(self, string):
+        return False
+
+
+def _region_css(rules):
+    return ', '.join(f'{tag}[{attr}*="{value}"]' for tag, attr, value in rules)
+
+
+def _slice_regions_with_selectolax(html, rules):
+    """Cuts the matching regions out of the page with selectolax, outermost matches only."""
+    tree = HTMLParser(html)
+    nodes = tree.css(_region_css(rules))
+    matched = {node.mem_id for node in nodes}
+    fragments = []
+    for node in nodes:
+        parent = node.parent
+        while parent is not None and parent.mem_id not in matched:
+            parent = parent.parent
+        if parent is None:
+            fragments.append(node.html)
+    return ''.join(fragments)
+
+
+def parse_page(html, site=None, backend=None):
+    """Parses a page into BeautifulSoup, keeping only the listing regions when site is given."""
+    with stage('parse', site):
+        return _parse_page(html, site, backend)
+
+
+def _parse_page(html, site, backend):
+    backend = backend or HTML_PARSER
+    if backend == 'html.parser':
+        return BeautifulSoup(html, 'html.parser')
+    if site is None:
+        return BeautifulSoup(html, 'lxml')
+
+    rules = PAGE_REGIONS[site]
+    if backend == 'selectolax' and HTMLParser is not None:
+        return BeautifulSoup(_slice_regions_with_selectolax(html, rules), 'lxml')
+    return BeautifulSoup(html, 'lxml', parse_only=RegionStrainer(rules))
+
+
+def compare_backends(html, site, extract, backends=('lxml', 'selectolax')):
+    """Checks extract(soup) gives the same result as with the old html.parser soup.
+
+    Returns {backend: True/False}; use it on saved pages after touching PAGE_REGIONS.
+    """
+    expected = extract(BeautifulSoup(html, 'html.parser'))
+    results = {}
+    for backend in backends:
+        if backend == 'selectolax' and HTMLParser is None:
+            continue
+        results[backend] = extract(_parse_page(html, site, backend)) == expected
+    return results
@@ -0,0 +1,166 @@
+import os
+import re
+import time
+
+from utils.browser_pool import register_worker_stats
+from utils.rate_limit import locked_json
+
+script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_proxies():
+    """"user:pass@host:port" entries from PROXY_LIST (comma/newline separated) or PROXY_LIST_FILE.
+
+    Falls back to the single proxy built from PROXY_USER/PROXY_PASSWORD/PROXY_HOST/PROXY_PORT.
+    """
+    text = os.environ.get('PROXY_LIST', '')
+    if os.environ.get('PROXY_LIST_FILE'):
+        with open(os.environ['PROXY_LIST_FILE'], encoding='utf-8') as f:
+            text += "\n" + f.read()
+    proxies = [re.sub(r'^https?://', '', item) for item in re.split(r'[\s,]+', text) if item]
+    if not proxies and os.environ.get('PROXY_HOST'):
+        proxies = [f"{os.environ['PROXY_USER']}:{os.environ['PROXY_PASSWORD']}"
+                   f"@{os.environ['PROXY_HOST']}:{os.environ['PROXY_PORT']}"]
+    return list(dict.fromkeys(proxies))
+
+
+PROXIES = load_proxies()
+# Health of every proxy and which worker is on which, shared by all processes (and kept between runs)
+STATE_PATH = os.environ.get('PROXY_HEALTH_FILE', os.path.join(script_dir, "cache", "proxy_pool", "health.json"))
+# A proxy is benched once more than this share of its last WINDOW page loads failed
+MAX_ERROR_RATE = float(os.environ.get('PROXY_MAX_ERROR_RATE', 0.5))
+COOLDOWN = float(os.environ.get('PROXY_COOLDOWN', 300))
+WINDOW = 20
+MIN_SAMPLES = 5
+LATENCY_SMOOTHING = 0.2
+
+_current = None
+_totals = {'pages': 0, 'failed': 0, 'swaps': 0}
+
+
+def label(proxy):
+    """host:port, so credentials never end up in logs or the health file."""
+    return proxy.rsplit('@', 1)[-1]
+
+
+def _initial_state():
+    return {'proxies': {}, 'assigned': {}}
+
+
+def _health(state, proxy):
+    return state['proxies'].setdefault(label(proxy), {'ok': 0, 'failed': 0, 'recent': [], 'latency': None,
+                                                      'benched_until': 0.0})
+
+
+def error_rate(health):
+    recent = health['recent']
+    return recent.count(0) / len(recent) if recent else 0.0
+
+
+def score(health):
+    """Higher is better: recent success rate, discounted by the average load time."""
+    return (1 - error_rate(health)) / (1 + (health['latency'] or 0.0) / 10)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def _pick(state, now):
+    """Healthy proxy with the fewest workers on it, best score first."""
+    state['assigned'] = {pid: name for pid, name in state['assigned'].items() if _alive(int(pid))}
+    load = {}
+    for name in state['assigned'].values():
+        load[name] = load.get(name, 0) + 1
+    healthy = [p for p in PROXIES if _health(state, p)['benched_until'] <= now]
+    if not healthy:
+        # Everything is benched; take whichever comes back first
+        return min(PROXIES, key=lambda p: _health(state, p)['benched_until'])
+    return min(healthy, key=lambda p: (load.get(label(p), 0), -score(_health(state, p))))
+
+
+def worker_proxy():
+    """This process's proxy, or None without any configured.
+
+    A worker keeps the same proxy (and so the same browser session) while that
+    proxy stays healthy, and moves to the best free one once it is benched.
+    """
+    global _current
+    if not PROXIES:
+        return None
+    previous = _current
+    with locked_json(STATE_PATH, _initial_state) as state:
+        now = time.time()
+        pid = str(os.getpid())
+        if (_current is not None and state['assigned'].get(pid) == label(_current)
+                and _health(state, _current)['benched_until'] <= now):
+            return _current
+        _current = _pick(state, now)
+        state['assigned'][pid] = label(_current)
+    if previous is not None and previous != _current:
+        _totals['swaps'] += 1
+        print(f"Proxy: worker {os.getpid()} moved from {label(previous)} to {label(_current)}")
+    return _current
+
+
+def record(proxy, ok, seconds=None):
+    """Scores proxy with one page load made through it; a spike in its error rate benches it.
+
+    proxy is the one the load actually used (None for a direct load, which is not scored),
+    not whichever one the worker holds now.
+    """
+    if proxy is None or not PROXIES:
+        return
+    _totals['pages'] += 1
+    if not ok:
+        _totals['failed'] += 1
+    with locked_json(STATE_PATH, _initial_state) as state:
+        health = _health(state, proxy)
+        health['ok' if ok else 'failed'] += 1
+        health['recent'] = (health['recent'] + [1 if ok else 0])[-WINDOW:]
+        if ok and seconds is not None:
+            previous = health['latency']
+            health['latency'] = seconds if previous is None else (
+                previous + LATENCY_SMOOTHING * (seconds - previous))
+        rate = error_rate(health)
+        if len(PROXIES) > 1 and len(health['recent']) >= MIN_SAMPLES and rate > MAX_ERROR_RATE:
+            health['benched_until'] = time.time() + COOLDOWN
+            # Judge it afresh once it is back
+            health['recent'] = []
+            print(f"Proxy {label(proxy)}: {rate:.0%} of recent pages failed, benched for {COOLDOWN:.0f}s")
+
+
+def snapshot():
+    return dict(_totals)
+
+
+def reset():
+    global _current
+    _current = None
+    for key in _totals:
+        _totals[key] = 0
+
+
+def print_proxy_report(snapshots):
+    totals = {key: sum(snap.get(key, 0) for snap in snapshots) for key in _totals}
+    if not totals['pages'] or len(PROXIES) < 2:
+        return totals
+    print(f"Proxies: {totals['pages']} pages, {totals['failed']} failed, {totals['swaps']} worker swaps")
+    with locked_json(STATE_PATH, _initial_state) as state:
+        now = time.time()
+        for proxy in PROXIES:
+            health = _health(state, proxy)
+            latency = f"{health['latency']:.1f}s" if health['latency'] is not None else "-"
+            benched = " (benched)" if health['benched_until'] > now else ""
+            print(f"  {label(proxy)}: score {score(health):.2f}, {error_rate(health):.0%} recent errors, "
+                  f"{latency} avg load, {health['ok']} ok / {health['failed']} failed{benched}")
+    return totals
+
+
+register_worker_stats('proxy_pool', snapshot, print_proxy_report, reset)
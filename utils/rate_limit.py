@@ -0,0 +1,200 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process locking on Windows; each process then keeps its own bucket
+    fcntl = None
+
+from utils.browser_pool import register_worker_stats
+
+script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Set RATE_LIMIT=0 to go back to the fixed sleeps only
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT', '1') != '0'
+# One small state file per domain, shared by every process (and kept between runs)
+STATE_DIR = os.environ.get('RATE_LIMIT_DIR', os.path.join(script_dir, "cache", "rate_limit"))
+
+# Page loads per second each domain starts at, e.g. RATE_LIMITS="capterra=1.5,shi=0.5".
+# The bucket is shared by every worker and covers HTTP pages too, so the default sits
+# above what a full pool does unthrottled (8 Capterra workers at roughly 2-4 pages/s);
+# the limiter only has to slow down once blocks show up.
+DEFAULT_RATE = float(os.environ.get('RATE_LIMIT_DEFAULT', 4.0))
+START_RATES = {}
+for item in os.environ.get('RATE_LIMITS', '').split(','):
+    if '=' in item:
+        site, value = item.split('=', 1)
+        START_RATES[site.strip()] = float(value)
+
+MIN_RATE = 0.05
+MAX_RATE = 10.0
+# One token per worker of the largest pool, so a pool starting up is not staggered
+BURST = 8
+# Halve at most once per window, so one burst of failures counts as one signal
+BACKOFF_WINDOW = 10
+# Probe 10% higher after this many good pages at the current rate
+PROBE_AFTER = 20
+
+# Present in any listing page that actually has products on it
+PRODUCT_MARKERS = {
+    'capterra': 'product-card-container',
+    'getapp': 'data-evt-name',
+    'shi': 'srProduct',
+    'g2': 'data-ordered-events-item',
+}
+
+_totals = {}
+
+
+def _new_totals():
+    return {'acquired': 0, 'waited_seconds': 0.0, 'blocked': 0, 'ok': 0, 'backoffs': 0, 'probes': 0}
+
+
+def _initial_state(site):
+    rate = START_RATES.get(site, DEFAULT_RATE)
+    return {'rate': rate, 'tokens': BURST, 'updated': time.time(), 'changed': 0.0, 'good': 0}
+
+
+@contextmanager
+def locked_json(path, initial):
+    """Read-modify-write of a small JSON file under an exclusive lock, across processes.
+
+    initial() builds the state when the file is new or unreadable; changes made to
+    the yielded object are written back on exit.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT)
+    with os.fdopen(fd, 'r+', encoding='utf-8') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            state = json.loads(f.read() or 'null')
+        except ValueError:
+            state = None
+        state = state or initial()
+        yield state
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps(state))
+        f.flush()
+
+
+def _locked_state(site):
+    return locked_json(os.path.join(STATE_DIR, f"{site}.json"), lambda: _initial_state(site))
+
+
+def acquire(site):
+    """Blocks until the domain's shared bucket has a token; returns the seconds waited."""
+    if not RATE_LIMIT_ENABLED:
+        return 0.0
+    totals = _totals.setdefault(site, _new_totals())
+    started = time.perf_counter()
+    while True:
+        with _locked_state(site) as state:
+            now = time.time()
+            state['tokens'] = min(BURST, state['tokens'] + (now - state['updated']) * state['rate'])
+            state['updated'] = now
+            if state['tokens'] >= 1:
+                state['tokens'] -= 1
+                break
+            wait = (1 - state['tokens']) / state['rate']
+        time.sleep(min(wait, 5))
+    waited = time.perf_counter() - started
+    totals['acquired'] += 1
+    totals['waited_seconds'] += waited
+    return waited
+
+
+def report(site, blocked):
+    """Feeds one page outcome back: blocked pages halve the rate, runs of good ones raise it."""
+    if not RATE_LIMIT_ENABLED:
+        return
+    totals = _totals.setdefault(site, _new_totals())
+    totals['blocked' if blocked else 'ok'] += 1
+    with _locked_state(site) as state:
+        now = time.time()
+        if blocked:
+            state['good'] = 0
+            if now - state['changed'] >= BACKOFF_WINDOW:
+                state['rate'] = max(MIN_RATE, state['rate'] / 2)
+                state['tokens'] = min(state['tokens'], 0)
+                state['changed'] = now
+                totals['backoffs'] += 1
+                print(f"Rate limit [{site}]: blocked, backing off to {state['rate']:.2f} pages/s")
+        else:
+            state['good'] += 1
+            if state['good'] >= PROBE_AFTER and state['rate'] < MAX_RATE:
+                state['rate'] = min(MAX_RATE, state['rate'] * 1.1)
+                state['good'] = 0
+                state['changed'] = now
+                totals['probes'] += 1
+
+
+def is_blocked_page(site, html, status_code=200, listing=True):
+    """403/429/503, a Cloudflare interstitial, or (for listing pages) no products at all."""
+    from utils.hybrid_fetch import CHALLENGE_STATUS_CODES, looks_like_challenge
+    if status_code in CHALLENGE_STATUS_CODES or looks_like_challenge(status_code, html or ''):
+        return True
+    marker = PRODUCT_MARKERS.get(site)
+    return bool(listing and marker and marker not in (html or ''))
+
+
+def page_outcome(site, html, status_code=200, listing=True):
+    blocked = is_blocked_page(site, html, status_code, listing)
+    report(site, blocked)
+    return blocked
+
+
+def current_rate(site):
+    with _locked_state(site) as state:
+        return state['rate']
+
+
+def snapshot():
+    return {site: dict(totals) for site, totals in _totals.items()}
+
+
+def reset():
+    _totals.clear()
+
+
+def prometheus_text(rates, totals):
+    lines = [
+        "# HELP scraper_rate_limit_pages_per_second Current page rate allowed per site.",
+        "# TYPE scraper_rate_limit_pages_per_second gauge",
+    ]
+    lines += [f'scraper_rate_limit_pages_per_second{{site="{site}"}} {rate:.4f}' for site, rate in sorted(rates.items())]
+    lines += [
+        "# HELP scraper_rate_limit_backoffs_total Times a site's rate was halved.",
+        "# TYPE scraper_rate_limit_backoffs_total counter",
+    ]
+    lines += [f'scraper_rate_limit_backoffs_total{{site="{site}"}} {t["backoffs"]}' for site, t in sorted(totals.items())]
+    return "\n".join(lines) + "\n"
+
+
+def print_rate_report(snapshots):
+    totals = {}
+    for snap in snapshots:
+        for site, site_totals in snap.items():
+            target = totals.setdefault(site, _new_totals())
+            for key, value in site_totals.items():
+                target[key] += value
+    if not totals or not RATE_LIMIT_ENABLED:
+        return totals
+    rates = {site: current_rate(site) for site in totals}
+    for site, t in sorted(totals.items()):
+        print(f"Rate limit [{site}]: now {rates[site]:.2f} pages/s, {t['acquired']} pages, "
+              f"{t['waited_seconds']:.1f}s waited, {t['blocked']} blocked / {t['ok']} ok, "
+              f"{t['backoffs']} backoffs, {t['probes']} probes up")
+
+    from utils.stage_timing import RUN_ID, TRACE_DIR
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    with open(os.path.join(TRACE_DIR, f"rate-{RUN_ID}.prom"), 'w', encoding='utf-8') as f:
+        f.write(prometheus_text(rates, totals))
+    return totals
+
+
+register_worker_stats('rate_limit', snapshot, print_rate_report, reset)
@@ -0,0 +1,167 @@
+import fnmatch
+import os
+
+from utils import page_cache
+from utils.browser_pool import register_worker_stats
+
+# Set BLOCK_RESOURCES=0 to load every page in full
+BLOCKING_ENABLED = os.environ.get('BLOCK_RESOURCES', '1') != '0'
+# Every Nth live load of a site is left unblocked, as the baseline for the report (0 = never)
+BASELINE_EVERY = int(os.environ.get('BLOCK_RESOURCES_BASELINE_EVERY', 20))
+
+# Network.setBlockedURLs wildcard patterns, by resource kind
+RESOURCE_PATTERNS = {
+    'images': ['*.png*', '*.jpg*', '*.jpeg*', '*.gif*', '*.webp*', '*.avif*', '*.svg*', '*.ico*'],
+    'media': ['*.mp4*', '*.webm*', '*.mp3*', '*.m3u8*', '*.ogg*', '*.mov*'],
+    'fonts': ['*.woff*', '*.woff2*', '*.ttf*', '*.otf*', '*.eot*'],
+    'trackers': [
+        '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*googlesyndication.com*',
+        '*facebook.net*', '*connect.facebook.com*', '*hotjar.com*', '*segment.com*', '*segment.io*',
+        '*clarity.ms*', '*bat.bing.com*', '*snap.licdn.com*', '*ads.linkedin.com*', '*criteo.*',
+        '*taboola.com*', '*outbrain.com*', '*quantserve.com*', '*scorecardresearch.com*', '*nr-data.net*',
+        '*newrelic.com*', '*optimizely.com*', '*fullstory.com*', '*intercom.io*', '*intercomcdn.com*',
+        '*driftt.com*', '*qualtrics.com*', '*demandbase.com*', '*6sc.co*', '*zoominfo.com*',
+    ],
+}
+
+# What each site can do without; override with BLOCK_PROFILES="g2=images+fonts,shi=none"
+PROFILES = {
+    'capterra': ['images', 'media', 'fonts', 'trackers'],
+    'getapp': ['images', 'media', 'fonts', 'trackers'],
+    'shi': ['images', 'media', 'fonts', 'trackers'],
+    'g2': ['images', 'media', 'fonts', 'trackers'],
+}
+for item in os.environ.get('BLOCK_PROFILES', '').split(','):
+    if '=' in item:
+        site, kinds = item.split('=', 1)
+        PROFILES[site.strip()] = [kind for kind in kinds.split('+') if kind in RESOURCE_PATTERNS]
+
+# Requests the Cloudflare / captcha challenges make; no pattern may block any of them
+CHALLENGE_ALLOWLIST = [
+    'https://challenges.cloudflare.com/turnstile/v0/api.js',
+    'https://challenges.cloudflare.com/cdn-cgi/challenge-platform/h/g/orchestrate/chl_page/v1',
+    'https://www.capterra.com/cdn-cgi/challenge-platform/scripts/jsd/main.js',
+    'https://www.google.com/recaptcha/api.js',
+    'https://www.gstatic.com/recaptcha/releases/api2/recaptcha__en.js',
+    'https://hcaptcha.com/1/api.js',
+]
+
+# Bytes actually transferred for the current document; blocked requests never show up
+TRANSFER_SIZE_JS = """
+var total = 0;
+var entries = performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'));
+for (var i = 0; i < entries.length; i++) { total += entries[i].transferSize || 0; }
+return total;
+"""
+
+_applied = {}
+_challenged = set()
+_loads = {}
+_totals = {}
+
+
+def blocked_patterns(site):
+    patterns = [p for kind in PROFILES.get(site, []) for p in RESOURCE_PATTERNS[kind]]
+    return [p for p in patterns if not any(fnmatch.fnmatchcase(url, p) for url in CHALLENGE_ALLOWLIST)]
+
+
+def _driver_key(sb):
+    # session_id too: a recycled browser's driver object may reuse the old id()
+    return id(sb.driver), getattr(sb.driver, 'session_id', None)
+
+
+def _set_blocked(sb, patterns):
+    key = _driver_key(sb)
+    if _applied.get(key) == patterns:
+        return True
+    try:
+        sb.driver.execute_cdp_cmd("Network.enable", {})
+        sb.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+    except Exception as e:
+        print(f"Could not set blocked URLs: {e}")
+        return False
+    _applied[key] = patterns
+    return True
+
+
+def before_load(sb, site):
+    """Applies the site's profile to the browser; returns whether this load is blocked.
+
+    Every BASELINE_EVERY-th load is left unblocked so the report can compare, and
+    so is every load on a browser that has met a challenge since blocking was on.
+    """
+    if not BLOCKING_ENABLED or page_cache.REPLAY or _driver_key(sb) in _challenged:
+        return False
+    n = _loads[site] = _loads.get(site, 0) + 1
+    baseline = BASELINE_EVERY and n % BASELINE_EVERY == 0
+    patterns = [] if baseline else blocked_patterns(site)
+    return _set_blocked(sb, patterns) and bool(patterns)
+
+
+def after_load(sb, site, blocked, seconds, html=None):
+    """Records the page's transferred bytes and load time against blocked or baseline."""
+    if not BLOCKING_ENABLED or page_cache.REPLAY:
+        return
+    if blocked and html is not None:
+        from utils.hybrid_fetch import looks_like_challenge
+        if looks_like_challenge(200, html):
+            # The challenge may need something the profile blocks; leave this browser alone from now on
+            print(f"Challenge on a blocked page ({site}); loading everything on this browser from now on")
+            _challenged.add(_driver_key(sb))
+            _set_blocked(sb, [])
+    elif not blocked and _driver_key(sb) in _challenged:
+        # Not a baseline sample, just a browser running without blocking
+        return
+    try:
+        transferred = int(sb.execute_script(TRANSFER_SIZE_JS) or 0)
+    except Exception:
+        transferred = 0
+    totals = _totals.setdefault(site, _new_totals())
+    kind = 'blocked' if blocked else 'baseline'
+    totals[kind]['pages'] += 1
+    totals[kind]['bytes'] += transferred
+    totals[kind]['seconds'] += seconds
+
+
+def _new_totals():
+    return {'blocked': {'pages': 0, 'bytes': 0, 'seconds': 0.0},
+            'baseline': {'pages': 0, 'bytes': 0, 'seconds': 0.0}}
+
+
+def snapshot():
+    return {site: {kind: dict(t) for kind, t in totals.items()} for site, totals in _totals.items()}
+
+
+def reset():
+    _applied.clear()
+    _challenged.clear()
+    _loads.clear()
+    _totals.clear()
+
+
+def print_blocking_report(snapshots):
+    merged = {}
+    for snap in snapshots:
+        for site, totals in snap.items():
+            target = merged.setdefault(site, _new_totals())
+            for kind, t in totals.items():
+                for key, value in t.items():
+                    target[kind][key] += value
+    for site, totals in sorted(merged.items()):
+        blocked, baseline = totals['blocked'], totals['baseline']
+        if not blocked['pages']:
+            continue
+        kb = blocked['bytes'] / blocked['pages'] / 1024
+        secs = blocked['seconds'] / blocked['pages']
+        line = f"Resource blocking [{site}]: {blocked['pages']} pages at {kb:.0f} KB, {secs:.2f}s each"
+        if baseline['pages']:
+            base_kb = baseline['bytes'] / baseline['pages'] / 1024
+            base_secs = baseline['seconds'] / baseline['pages']
+            saved_mb = (base_kb - kb) * blocked['pages'] / 1024
+            line += (f" vs {base_kb:.0f} KB, {base_secs:.2f}s unblocked ({baseline['pages']} baseline pages): "
+                     f"~{saved_mb:.1f} MB saved, {secs - base_secs:+.2f}s per page")
+        print(line)
+    return merged
+
+
+register_worker_stats('resource_blocking', snapshot, print_blocking_report, reset)
@@ -0,0 +1,320 @@
+import hashlib
+import json
+import os
+import queue
+import statistics
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from utils import stream_writer
+from utils.checkpoint import journal_page, journal_pages_done, journal_result, row_key
+from utils.stage_timing import set_context
+
+# Categories with at least this many pages have pages 2..N spread over idle workers
+FANOUT_MIN_PAGES = int(os.environ.get('FANOUT_MIN_PAGES', 6))
+
+_task_pages = None
+_in_scheduler = False
+_task_fingerprint = None
+_previous_fingerprint = None
+
+
+class Unchanged:
+    """Returned by a category task whose first page matches the last run (--delta)."""
+
+
+UNCHANGED = Unchanged()
+
+
+def note_pages(n_pages):
+    """Called by a scraper once it knows how many pages its category has."""
+    global _task_pages
+    _task_pages = n_pages
+
+
+def fingerprint(n_pages, first_records):
+    digest = hashlib.sha1(json.dumps(first_records, sort_keys=True, default=str).encode('utf-8'))
+    return {'pages': n_pages, 'first_page_products': len(first_records), 'first_page_hash': digest.hexdigest()}
+
+
+def unchanged_since_last_run(n_pages, first_records):
+    """Called by a scraper after page 1; True when the rest of the category can be skipped.
+
+    Always records the fingerprint so the next run has something to compare with.
+    """
+    global _task_fingerprint
+    _task_fingerprint = fingerprint(n_pages, first_records)
+    return _previous_fingerprint is not None and _task_fingerprint == _previous_fingerprint
+
+
+class FanOut:
+    """Returned by a category task instead of its result when the category is large.
+
+    Holds page 1's records and the remaining page URLs; the scheduler runs
+    page_func(row, url, context) for each URL on whichever worker is free. Each
+    page is streamed as it lands and the exports keep them in page order.
+    """
+
+    def __init__(self, first_records, page_urls, page_func, context=None):
+        self.first_records = first_records
+        self.page_urls = page_urls
+        self.page_func = page_func
+        self.context = context
+
+
+def should_fan_out(page_urls):
+    """True when the remaining pages should become their own scheduler tasks."""
+    return _in_scheduler and FANOUT_MIN_PAGES > 0 and len(page_urls) + 1 >= FANOUT_MIN_PAGES
+
+
+def _run_category_task(func, site, journal_dir, key_field, label, index, row, previous_fingerprint=None):
+    """Scrapes one category and streams its records to the writer; only counts go back."""
+    global _task_pages, _in_scheduler, _task_fingerprint, _previous_fingerprint
+    _task_pages = None
+    _task_fingerprint = None
+    _previous_fingerprint = previous_fingerprint
+    _in_scheduler = True
+    key = row_key(row, key_field)
+    set_context(site, key)
+    try:
+        result = func(row)
+    finally:
+        _in_scheduler = False
+        _previous_fingerprint = None
+    if isinstance(result, FanOut):
+        # Page 1 is handled here like any other page, so the parent never sees its records
+        journal_page(journal_dir, key, 0, result.first_records)
+        stream_writer.send(site, label, (index, 0), result.first_records)
+        result.first_records = None
+    elif not isinstance(result, Unchanged):
+        journal_result(journal_dir, key, result, _task_fingerprint)
+        result = stream_writer.send(site, label, (index, 0), result)
+    return 'category', index, result, _task_pages, _task_fingerprint
+
+
+def _run_page_task(page_func, site, journal_dir, category, label, index, page_no, row, url, context):
+    set_context(site, category)
+    try:
+        records = page_func(row, url, context)
+    except Exception as e:
+        # Not journaled, so the category never completes and --resume scrapes it again
+        print(f"Page task failed for {url}: {e}")
+        return 'page', index, page_no, None
+    journal_page(journal_dir, category, page_no, records)
+    return 'page', index, page_no, stream_writer.send(site, label, (index, page_no), records)
+
+
+class CategoryScheduler:
+    """Runs every category through one shared task queue, longest first.
+
+    Page counts seen on earlier runs (result/page_counts/<site>.json) decide the
+    order, so the big categories start early instead of setting the makespan.
+    Pages fanned out by large categories jump ahead of categories not yet started.
+    Records are streamed to a StreamWriter rather than returned; on_part still
+    fires per np.array_split part, reading that part's rows back from the journal.
+    With --delta, categories whose first page matches the last run get their
+    previous rows back instead of being paginated.
+    """
+
+    def __init__(self, site, result_dir, journal):
+        self.site = site
+        self.journal = journal
+        self.history_path = os.path.join(result_dir, "page_counts", f"{site}.json")
+        self.page_counts = self.load_history()
+
+    def load_history(self):
+        try:
+            with open(self.history_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def save_history(self):
+        os.makedirs(os.path.dirname(self.history_path), exist_ok=True)
+        tmp_path = self.history_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.page_counts, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.history_path)
+
+    def order_longest_first(self, items, key_field):
+        known = [self.page_counts[row_key(row, key_field)] for _, row in items
+                 if row_key(row, key_field) in self.page_counts]
+        default = statistics.median(known) if known else 0
+        # sorted() is stable, so with no history the original order is kept
+        return sorted(items, key=lambda item: -self.page_counts.get(row_key(item[1], key_field), default))
+
+    def start(self, func, rows, key_field, category_label, n_parts=1, on_part=None, as_frame=True):
+        """Streams the journaled rows and returns a SiteRun holding the rest, for run_sites()."""
+        return SiteRun(self, func, rows, key_field, category_label, n_parts, on_part, as_frame)
+
+    def run(self, pool, func, rows, key_field, category_label, n_parts=1, on_part=None, as_frame=True):
+        """Scrapes every row not yet journaled, over a pool whose workers send to a StreamWriter.
+
+        category_label(row) names the output partition. on_part(part_index,
+        part_rows, part_results) fires once every row of an np.array_split part is
+        done; part_results is a generator that reads the part back from the journal.
+        """
+        run_sites(pool, [self.start(func, rows, key_field, category_label, n_parts, on_part, as_frame)])
+
+
+class SiteRun:
+    """One site's remaining categories and fanned-out pages inside run_sites()."""
+
+    def __init__(self, scheduler, func, rows, key_field, category_label, n_parts, on_part, as_frame):
+        self.scheduler = scheduler
+        self.site = scheduler.site
+        self.journal = scheduler.journal
+        self.func = func
+        self.rows = rows
+        self.key_field = key_field
+        self.category_label = category_label
+        self.on_part = on_part
+        self.as_frame = as_frame
+        self.parts = np.array_split(np.arange(len(rows)), n_parts)
+        self.part_of = {int(index): part_idx for part_idx, part in enumerate(self.parts) for index in part}
+        self.remaining = [len(part) for part in self.parts]
+        self.in_flight = 0
+        self.done = 0
+        self.reused = 0
+        self.fanned_out = {}
+
+        todo = []
+        for index, row in enumerate(rows):
+            records = self.journal.done.get(row_key(row, key_field))
+            if records is None:
+                todo.append((index, row))
+            else:
+                stream_writer.send(self.site, category_label(row), (index, 0), records)
+                self.deliver(index)
+        if len(todo) < len(rows):
+            print(f"Skipping {len(rows) - len(todo)} of {len(rows)} categories already in the {self.site} journal")
+        self.n_todo = len(todo)
+        self.category_tasks = deque(scheduler.order_longest_first(todo, key_field))
+        self.page_tasks = deque()
+
+    def has_work(self):
+        return bool(self.page_tasks or self.category_tasks)
+
+    def next_task(self):
+        """(function, args) of the next task; fanned-out pages go before new categories."""
+        if self.page_tasks:
+            return _run_page_task, self.page_tasks.popleft()
+        index, row = self.category_tasks.popleft()
+        previous = self.journal.previous.get(row_key(row, self.key_field))
+        return _run_category_task, (self.func, self.site, self.journal.journal_dir, self.key_field,
+                                    self.category_label(row), index, row, previous and previous['fingerprint'])
+
+    def part_results(self, part_rows):
+        for records in self.journal.records_for([row_key(row, self.key_field) for row in part_rows]):
+            yield pd.DataFrame(records) if self.as_frame else records
+
+    def deliver(self, index):
+        if self.on_part is None:
+            return
+        part_idx = self.part_of[index]
+        self.remaining[part_idx] -= 1
+        if self.remaining[part_idx] == 0:
+            part_rows = [self.rows[int(i)] for i in self.parts[part_idx]]
+            self.on_part(part_idx, part_rows, self.part_results(part_rows))
+
+    def finish_category(self, index, pages):
+        key = row_key(self.rows[index], self.key_field)
+        if pages is not None:
+            self.scheduler.page_counts[key] = pages
+        self.done += 1
+        print(f"[{self.site}] {self.done}/{self.n_todo} categories done")
+        self.deliver(index)
+
+    def handle(self, message):
+        rows, key_field = self.rows, self.key_field
+        if message[0] == 'category':
+            _, index, result, pages, page_fingerprint = message
+            key = row_key(rows[index], key_field)
+            if isinstance(result, Unchanged):
+                records = self.journal.previous[key]['records']
+                journal_result(self.journal.journal_dir, key, records, page_fingerprint)
+                stream_writer.send(self.site, self.category_label(rows[index]), (index, 0), records)
+                self.reused += 1
+                self.finish_category(index, pages)
+            elif isinstance(result, FanOut):
+                print(f"[{self.site}] Fanning out {len(result.page_urls)} pages of {key}")
+                self.fanned_out[index] = {
+                    'left': len(result.page_urls),
+                    'failed': 0,
+                    'journaled_pages': len(result.page_urls) + 1,
+                    'n_pages': pages,
+                    'fingerprint': page_fingerprint,
+                }
+                label = self.category_label(rows[index])
+                for page_no, url in enumerate(result.page_urls, start=1):
+                    self.page_tasks.append((result.page_func, self.site, self.journal.journal_dir, key, label,
+                                            index, page_no, rows[index], url, result.context))
+            else:
+                self.finish_category(index, pages)
+        else:
+            _, index, page_no, n_records = message
+            state = self.fanned_out[index]
+            state['left'] -= 1
+            if n_records is None:
+                state['failed'] += 1
+            if state['left'] == 0:
+                del self.fanned_out[index]
+                key = row_key(rows[index], key_field)
+                if state['failed']:
+                    print(f"[{self.site}] {state['failed']} pages of {key} failed, leaving it for --resume")
+                else:
+                    # Page 1 plus every fanned-out page is now in the journal
+                    journal_pages_done(self.journal.journal_dir, key, state['journaled_pages'], state['fingerprint'])
+                self.finish_category(index, state['n_pages'])
+
+    def finish(self):
+        if self.reused:
+            print(f"[{self.site}] {self.reused} of {self.n_todo} categories unchanged since the last run, "
+                  f"reused their rows")
+        self.scheduler.save_history()
+
+
+def run_sites(pool, runs, limits=None):
+    """Drives one or more SiteRuns over a single pool until all are done.
+
+    limits caps how many tasks each site may have in flight at once (default: the
+    pool size). Fanned-out pages go first; otherwise the next task comes from the
+    site using the smallest share of its limit, so every site keeps moving.
+    """
+    limits = limits or {}
+    completed = queue.Queue()
+    # Only hand the pool as many tasks as it has workers, so fanned-out pages
+    # queued later still go ahead of categories that have not started yet
+    max_in_flight = getattr(pool, 'processes', None) or pool._processes
+    in_flight = 0
+
+    def limit(run):
+        return min(limits.get(run.site) or max_in_flight, max_in_flight)
+
+    def submit():
+        nonlocal in_flight
+        while in_flight < max_in_flight:
+            ready = [run for run in runs if run.has_work() and run.in_flight < limit(run)]
+            if not ready:
+                break
+            run = min(ready, key=lambda r: (not r.page_tasks, r.in_flight / limit(r)))
+            func, args = run.next_task()
+            pool.apply_async(func, args, callback=lambda message, run=run: completed.put((run, message)),
+                             error_callback=lambda error, run=run: completed.put((run, error)))
+            run.in_flight += 1
+            in_flight += 1
+
+    submit()
+    while in_flight:
+        run, message = completed.get()
+        in_flight -= 1
+        run.in_flight -= 1
+        if isinstance(message, BaseException):
+            raise message
+        run.handle(message)
+        submit()
+
+    for run in runs:
+        run.finish()
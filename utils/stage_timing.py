@@ -0,0 +1,161 @@
+import functools
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from utils.browser_pool import register_worker_stats
+
+script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Set STAGE_TRACE=0 to keep the in-memory summary but skip the JSONL trace
+TRACE_ENABLED = os.environ.get('STAGE_TRACE', '1') != '0'
+TRACE_DIR = os.environ.get('STAGE_TRACE_DIR', os.path.join(script_dir, "cache", "trace"))
+# One id per run; exported so spawned workers write under the same run
+RUN_ID = os.environ.setdefault('STAGE_TRACE_RUN', time.strftime('%Y%m%d-%H%M%S'))
+
+STAGES = ['open', 'challenge', 'wait', 'http', 'page_source', 'parse', 'records', 'resolve']
+STAGE_BUCKETS = [0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60]
+
+_context = {'site': None, 'category': None}
+_stages = {}
+_categories = {}
+_trace = {'pid': None, 'file': None}
+
+
+def set_context(site=None, category=None):
+    """Tags every following stage in this process with site and category."""
+    _context['site'] = site
+    _context['category'] = category
+
+
+def _new_histogram():
+    return {'buckets': [0] * (len(STAGE_BUCKETS) + 1), 'count': 0, 'sum': 0.0}
+
+
+def _write_trace(event):
+    if _trace['pid'] != os.getpid():
+        # Forked workers must not share the parent's file handle
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        path = os.path.join(TRACE_DIR, f"trace-{RUN_ID}-{os.getpid()}.jsonl")
+        _trace['file'] = open(path, 'a', encoding='utf-8', buffering=1)
+        _trace['pid'] = os.getpid()
+    _trace['file'].write(json.dumps(event) + "\n")
+
+
+def record_stage(name, seconds, site=None):
+    site = site or _context['site'] or 'unknown'
+    category = _context['category']
+    hist = _stages.setdefault((site, name), _new_histogram())
+    for i, bound in enumerate(STAGE_BUCKETS):
+        if seconds <= bound:
+            hist['buckets'][i] += 1
+            break
+    else:
+        hist['buckets'][-1] += 1
+    hist['count'] += 1
+    hist['sum'] += seconds
+    if category is not None:
+        _categories[(site, category)] = _categories.get((site, category), 0.0) + seconds
+    if TRACE_ENABLED:
+        _write_trace({
+            'ts': round(time.time(), 3), 'site': site, 'category': category,
+            'worker': os.getpid(), 'stage': name, 'seconds': round(seconds, 4),
+        })
+
+
+@contextmanager
+def stage(name, site=None):
+    """Times the with-block as one stage of the current page."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started, site)
+
+
+def timed(name, site=None):
+    """Decorator form of stage()."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name, site):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    return {
+        'stages': {key: dict(hist, buckets=list(hist['buckets'])) for key, hist in _stages.items()},
+        'categories': dict(_categories),
+    }
+
+
+def reset():
+    _stages.clear()
+    _categories.clear()
+    set_context()
+
+
+def merge_snapshots(snapshots):
+    stages = {}
+    categories = {}
+    for snap in snapshots:
+        for key, hist in snap['stages'].items():
+            target = stages.setdefault(key, _new_histogram())
+            target['buckets'] = [a + b for a, b in zip(target['buckets'], hist['buckets'])]
+            target['count'] += hist['count']
+            target['sum'] += hist['sum']
+        for key, seconds in snap['categories'].items():
+            categories[key] = categories.get(key, 0.0) + seconds
+    return stages, categories
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def prometheus_text(stages):
+    lines = [
+        "# HELP scraper_stage_seconds Time spent in each page stage.",
+        "# TYPE scraper_stage_seconds histogram",
+    ]
+    for (site, name), hist in sorted(stages.items()):
+        labels = f'site="{_label(site)}",stage="{_label(name)}"'
+        cumulative = 0
+        for bound, n in zip(STAGE_BUCKETS + ['+Inf'], hist['buckets']):
+            cumulative += n
+            lines.append(f'scraper_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'scraper_stage_seconds_sum{{{labels}}} {hist["sum"]:.4f}')
+        lines.append(f'scraper_stage_seconds_count{{{labels}}} {hist["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+def print_stage_report(snapshots, top=5):
+    stages, categories = merge_snapshots(snapshots)
+    if not stages:
+        return stages
+    for site in sorted({site for site, _ in stages}):
+        site_stages = {name: hist for (s, name), hist in stages.items() if s == site}
+        total = sum(hist['sum'] for hist in site_stages.values()) or 1.0
+        order = sorted(site_stages, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES))
+        print(f"Stage timings [{site}]:")
+        for name in order:
+            hist = site_stages[name]
+            print(f"    {name:<12} {hist['sum']:>9.1f}s  {100 * hist['sum'] / total:5.1f}%  "
+                  f"{hist['count']:>6} calls  avg {hist['sum'] / hist['count']:.3f}s")
+        slowest = sorted(((s, c) for s, c in categories if s == site),
+                         key=lambda key: -categories[key])[:top]
+        if slowest:
+            print("    slowest categories: " + ", ".join(f"{c} ({categories[(site, c)]:.1f}s)" for _, c in slowest))
+
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    path = os.path.join(TRACE_DIR, f"stages-{RUN_ID}.prom")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(prometheus_text(stages))
+    print(f"Stage metrics written to {path}" + (f", traces in {TRACE_DIR}" if TRACE_ENABLED else ""))
+    return stages
+
+
+register_worker_stats('stage_timing', snapshot, print_stage_report, reset)
@@ -0,0 +1,112 @@
+import multiprocessing
+import os
+import time
+
+import pandas as pd
+
+from utils.browser_pool import register_worker_stats
+from utils.dedupe import ProductIndex
+from utils.output_sink import RecordSink
+
+# Chunks of records waiting for the writer; a full queue makes the scrapers wait
+QUEUE_SIZE = int(os.environ.get('STREAM_QUEUE_SIZE', 32))
+CHUNK_ROWS = int(os.environ.get('STREAM_CHUNK_ROWS', 500))
+
+_queue = None
+_totals = {'rows': 0, 'chunks': 0, 'blocked_seconds': 0.0}
+
+
+def attach(queue):
+    """Points send() at the writer's queue; done in the parent and in each pool worker."""
+    global _queue
+    _queue = queue
+
+
+def send(site, category, order, result):
+    """Streams records to the writer process, CHUNK_ROWS at a time; returns how many.
+
+    order sorts the chunks in the exports, e.g. (category index, page number).
+    Blocks while the queue is full, so a slow disk slows the scrapers down
+    instead of piling records up in memory.
+    """
+    records = result.to_dict('records') if isinstance(result, pd.DataFrame) else list(result)
+    for chunk_no, start in enumerate(range(0, len(records), CHUNK_ROWS)):
+        started = time.perf_counter()
+        _queue.put(('records', site, category, (*order, chunk_no), records[start:start + CHUNK_ROWS]))
+        _totals['blocked_seconds'] += time.perf_counter() - started
+        _totals['chunks'] += 1
+    _totals['rows'] += len(records)
+    return len(records)
+
+
+def _writer_main(queue, done, result_dir, sites):
+    sinks = {site: RecordSink(site, result_dir) for site in sites}
+    products = {site: ProductIndex(site, result_dir) for site in sites}
+    while True:
+        message = queue.get()
+        if message[0] == 'close':
+            break
+        _, site, category, order, records = message
+        sinks[site].write(category, records, order=order)
+        products[site].add(records)
+    for index in products.values():
+        index.write()
+    done.put({site: sink.state() for site, sink in sinks.items()})
+
+
+class StreamWriter:
+    """Dedicated process that owns every site's RecordSink and ProductIndex.
+
+    Workers send their records here over one bounded queue instead of returning
+    them through the pool, so the parent never holds a category's rows. After
+    close(), self.sinks has a read-only RecordSink per site for the exports.
+    """
+
+    def __init__(self, result_dir, sites):
+        self.queue = multiprocessing.Queue(maxsize=QUEUE_SIZE)
+        self._done = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=_writer_main, args=(self.queue, self._done, result_dir, sites),
+                                               daemon=True)
+        self.process.start()
+        self.sinks = None
+        attach(self.queue)
+
+    def close(self):
+        # Only once the pool has exited, so every worker's queued chunks are in
+        self.queue.put(('close',))
+        states = self._done.get()
+        self.process.join()
+        attach(None)
+        self.sinks = {site: RecordSink.from_state(site, state) for site, state in states.items()}
+        return self.sinks
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.process.terminate()
+            attach(None)
+            return False
+        self.close()
+        return False
+
+
+def snapshot():
+    return dict(_totals)
+
+
+def reset():
+    for key in _totals:
+        _totals[key] = 0
+
+
+def print_stream_report(snapshots):
+    totals = {key: sum(snap.get(key, 0) for snap in snapshots) for key in _totals}
+    if totals['chunks']:
+        print(f"Record stream: {totals['rows']} rows in {totals['chunks']} chunks, "
+              f"{totals['blocked_seconds']:.1f}s spent waiting on a full queue")
+    return totals
+
+
+register_worker_stats('stream_writer', snapshot, print_stream_report, reset)
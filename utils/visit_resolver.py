@@ -0,0 +1,124 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
+from curl_cffi import requests as curl_requests
+
+from utils import page_cache, rate_limit
+from utils.browser_pool import register_worker_stats
+from utils.dedupe import SharedIndex
+from utils.hybrid_fetch import get_http_session, looks_like_challenge
+
+script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Outbound website URLs keyed by product key; kept across runs like the page cache
+CACHE_DIR = os.environ.get('VISIT_URL_CACHE_DIR', os.path.join(script_dir, "cache", "visit_urls"))
+CACHE_TTL = float(os.environ.get('VISIT_URL_TTL', 30 * 24 * 3600))
+RESOLVE_WORKERS = int(os.environ.get('VISIT_RESOLVE_WORKERS', 8))
+
+META_REFRESH = re.compile(r'<meta[^>]+http-equiv=["\']?refresh["\']?[^>]*content=["\']?\d*\s*;\s*url=([^"\'>]+)',
+                          re.IGNORECASE)
+JS_REDIRECT = re.compile(r'(?:window|document|top)\.location(?:\.href)?\s*=\s*["\']([^"\']+)["\']')
+
+_cache = None
+_executor = None
+_totals = {'cached': 0, 'http': 0, 'clicked': 0, 'failed': 0}
+
+
+def _index():
+    global _cache
+    if _cache is None:
+        # Shared with the other workers, so a product resolved anywhere in this run is resolved once
+        _cache = SharedIndex(CACHE_DIR, ttl=None if page_cache.REPLAY else CACHE_TTL)
+    return _cache
+
+
+def get(key):
+    return _index().get(key)
+
+
+def remember(key, url, how='clicked'):
+    """Stores a resolved URL; how is 'http' or 'clicked', for the report."""
+    _totals[how] += 1
+    _index().put(key, url, persist=not page_cache.REPLAY)
+
+
+def _is_same_site(url, host):
+    return urlsplit(url).netloc.endswith(host)
+
+
+def follow_redirects(url, host, timeout=20):
+    """Follows HTTP, meta-refresh and location.href redirects until url leaves host."""
+    session = get_http_session()
+    site = host.split('.')[0]
+    for _ in range(3):
+        rate_limit.acquire(site)
+        try:
+            response = session.get(url, allow_redirects=True, timeout=timeout)
+        except curl_requests.exceptions.RequestException as e:
+            print(f"Could not resolve {url}: {e}")
+            return None
+        final_url = str(response.url)
+        if not _is_same_site(final_url, host):
+            return final_url
+        if looks_like_challenge(response.status_code, response.text):
+            rate_limit.report(site, blocked=True)
+            return None
+        match = META_REFRESH.search(response.text) or JS_REDIRECT.search(response.text)
+        if not match:
+            return None
+        url = urljoin(final_url, match.group(1).strip())
+        if not _is_same_site(url, host):
+            return url
+    return None
+
+
+def resolve_all(targets, host):
+    """Resolves {product key: outbound link} concurrently; returns {key: website URL}.
+
+    Cached keys are answered without a request, and keys that could not be resolved
+    over HTTP are left out so the caller can fall back to clicking through.
+    """
+    global _executor
+    resolved = {}
+    todo = {}
+    for key, target in targets.items():
+        url = get(key)
+        if url is not None:
+            _totals['cached'] += 1
+            resolved[key] = url
+        elif target and not page_cache.REPLAY:
+            todo[key] = target
+    if todo:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=RESOLVE_WORKERS)
+        urls = list(_executor.map(lambda target: follow_redirects(target, host), todo.values()))
+        for key, url in zip(todo, urls):
+            if url is None:
+                _totals['failed'] += 1
+            else:
+                remember(key, url, how='http')
+                resolved[key] = url
+    return resolved
+
+
+def snapshot():
+    return dict(_totals)
+
+
+def reset():
+    for key in _totals:
+        _totals[key] = 0
+
+
+def print_resolver_report(snapshots):
+    totals = {key: sum(snap.get(key, 0) for snap in snapshots) for key in _totals}
+    lookups = totals['cached'] + totals['http'] + totals['clicked']
+    if lookups or totals['failed']:
+        print(f"Visit URLs: {totals['cached']} from cache, {totals['http']} resolved over HTTP, "
+              f"{totals['clicked']} clicked through ({totals['failed']} HTTP misses)")
+    return totals
+
+
+register_worker_stats('visit_resolver', snapshot, print_resolver_report, reset)
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import fasteners
+from seleniumbase import SB
+from seleniumbase.core import proxy_helper
+
+from utils import page_cache
+from utils.browser_pool import register_worker_stats
+
+script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# `python scrape_x.py --warm-start` starts every pool browser from a prepared profile
+WARM_START = '--warm-start' in sys.argv or os.environ.get('WARM_START') == '1'
+WARM_DIR = os.environ.get('WARM_START_DIR', os.path.join(script_dir, "cache", "warm_start"))
+
+_template = None
+_starts = {'cold': [], 'warm': []}
+
+
+def prepare(**sb_kwargs):
+    """Once per run, in the parent before the pool forks: one throwaway browser start.
+
+    That start downloads and patches the uc driver and fills a template profile
+    directory, so worker starts only have to clone the profile and can skip the
+    driver version check that otherwise runs under SeleniumBase's driver lock.
+    """
+    global _template
+    if not WARM_START or _template is not None or page_cache.REPLAY:
+        return
+    # Rebuilt every run, so a Chrome update never meets a stale profile
+    shutil.rmtree(WARM_DIR, ignore_errors=True)
+    os.makedirs(WARM_DIR)
+    template = os.path.join(WARM_DIR, "profile-template")
+    started = time.perf_counter()
+    with SB(**{'uc': True, 'headless': True, **sb_kwargs, 'user_data_dir': template}) as sb:
+        sb.open("about:blank")
+    seconds = time.perf_counter() - started
+    _starts['cold'].append(seconds)
+    _template = template
+    print(f"Prepared the warm-start profile and driver in {seconds:.1f}s")
+
+
+def clone(src, dst):
+    """Copy-on-write copy where the filesystem supports it (cp --reflink), a plain copy otherwise."""
+    shutil.rmtree(dst, ignore_errors=True)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        subprocess.run(['cp', '-a', '--reflink=auto', src, dst], check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError):
+        shutil.rmtree(dst, ignore_errors=True)
+        shutil.copytree(src, dst, symlinks=True)
+    # Left behind if the template browser did not exit cleanly; Chrome refuses a locked profile
+    for name in ('SingletonLock', 'SingletonCookie', 'SingletonSocket'):
+        path = os.path.join(dst, name)
+        if os.path.lexists(path):
+            os.remove(path)
+    return dst
+
+
+def proxy_extension(proxy):
+    """The proxy-auth extension for proxy, built once per run and shared by every start."""
+    scheme, _, address = proxy.rpartition('://')
+    credentials, _, server = address.rpartition('@')
+    user, _, password = credentials.partition(':')
+    path = os.path.join(WARM_DIR, "proxy_ext", hashlib.sha1(proxy.encode('utf-8')).hexdigest()[:12])
+    if os.path.isdir(path):
+        return path
+    # SeleniumBase builds it in downloaded_files/proxy_ext_dir, under its own lock
+    with fasteners.InterProcessLock(proxy_helper.PROXY_DIR_LOCK):
+        if not os.path.isdir(path):
+            proxy_helper.create_proxy_ext(server, user, password, scheme or 'http', zip_it=False)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            shutil.copytree(proxy_helper.PROXY_DIR_PATH, tmp_path)
+            os.replace(tmp_path, path)
+    return path
+
+
+def browser_kwargs(sb_kwargs):
+    """(kwargs for SB, warm?) for one worker browser start.
+
+    Warm starts get a fresh clone of the template profile, keep the prepared
+    driver, and load a prebuilt proxy extension instead of having SeleniumBase
+    rebuild it under proxy_dir.lock on every start.
+    """
+    if _template is None or page_cache.REPLAY or 'user_data_dir' in sb_kwargs:
+        return sb_kwargs, False
+    kwargs = dict(sb_kwargs)
+    kwargs['user_data_dir'] = clone(_template, os.path.join(WARM_DIR, "workers", str(os.getpid())))
+    kwargs.setdefault('driver_version', 'keep')
+    proxy = kwargs.get('proxy')
+    if proxy and '@' in proxy:
+        del kwargs['proxy']
+        extensions = [kwargs['extension_dir']] if kwargs.get('extension_dir') else []
+        kwargs['extension_dir'] = ','.join(extensions + [proxy_extension(proxy)])
+    return kwargs, True
+
+
+def record(warm, seconds):
+    _starts['warm' if warm else 'cold'].append(seconds)
+
+
+def snapshot():
+    return {'pid': os.getpid(), 'cold': list(_starts['cold']), 'warm': list(_starts['warm'])}
+
+
+def reset():
+    for starts in _starts.values():
+        starts.clear()
+
+
+def _average(values):
+    return sum(values) / len(values) if values else 0.0
+
+
+def print_startup_report(snapshots):
+    cold = [seconds for snap in snapshots for seconds in snap['cold']]
+    warm = [seconds for snap in snapshots for seconds in snap['warm']]
+    if not cold and not warm:
+        return {}
+    print(f"Browser starts: cold {_average(cold):.2f}s avg over {len(cold)}, "
+          f"warm {_average(warm):.2f}s avg over {len(warm)}")
+    for snap in snapshots:
+        if snap['cold'] or snap['warm']:
+            print(f"    pid {snap['pid']}: cold {_average(snap['cold']):.2f}s x {len(snap['cold'])}, "
+                  f"warm {_average(snap['warm']):.2f}s x {len(snap['warm'])}")
+    return {'cold_starts': len(cold), 'cold_avg_seconds': _average(cold),
+            'warm_starts': len(warm), 'warm_avg_seconds': _average(warm)}
+
+
+register_worker_stats('warm_start', snapshot, print_startup_report, reset)
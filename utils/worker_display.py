@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+
+import seleniumbase.undetected
+from filelock import FileLock
+from seleniumbase import config as sb_config
+from seleniumbase.core import browser_launcher, sb_cdp
+from seleniumbase.fixtures import constants, page_actions
+
+from utils.browser_pool import register_worker_stats
+
+# SeleniumBase guards every pyautogui move/click with this one file, shared by all processes
+SHARED_LOCK = constants.MultiBrowser.PYAUTOGUILOCK
+# Set ISOLATED_DISPLAYS=0 to go back to the one shared lock
+ISOLATED = (sys.platform.startswith('linux') and os.environ.get('ISOLATED_DISPLAYS', '1') != '0'
+            and '--headed' not in sys.argv and '--gui' not in sys.argv)
+
+_waits = {'acquisitions': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0, 'isolated': 0}
+
+
+class TimedFileLock(FileLock):
+    """FileLock that records how long acquiring the pyautogui lock took."""
+
+    def acquire(self, *args, **kwargs):
+        if not os.path.basename(self.lock_file).startswith('pyautogui'):
+            return super().acquire(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return super().acquire(*args, **kwargs)
+        finally:
+            waited = time.perf_counter() - started
+            _waits['acquisitions'] += 1
+            _waits['wait_seconds'] += waited
+            _waits['max_wait_seconds'] = max(_waits['max_wait_seconds'], waited)
+            if self.lock_file != SHARED_LOCK:
+                _waits['isolated'] += 1
+
+
+for _module in (browser_launcher, sb_cdp, page_actions, seleniumbase.undetected):
+    _module.FileLock = TimedFileLock
+
+
+def private_display():
+    """The X display of this process's own SeleniumBase Xvfb, or None when sharing one."""
+    if getattr(sb_config, '_virtual_display', None) is None:
+        return None
+    return os.environ.get('DISPLAY')
+
+
+def isolate_session():
+    """Called after each browser start: scopes the pyautogui lock to the worker's display.
+
+    In uc mode on Linux every SB session runs on an Xvfb server of its own, so
+    the mouse and keyboard of one worker never touch another worker's screen
+    and only sessions on the same display need to take turns.
+    """
+    display = private_display() if ISOLATED else None
+    if display is None:
+        constants.MultiBrowser.PYAUTOGUILOCK = SHARED_LOCK
+        return
+    name = display.replace(':', '').replace('.', '-')
+    constants.MultiBrowser.PYAUTOGUILOCK = os.path.join(os.path.dirname(SHARED_LOCK), f"pyautogui-{name}.lock")
+
+
+def snapshot():
+    return dict(_waits)
+
+
+def reset():
+    for key in _waits:
+        _waits[key] = 0
+
+
+def print_lock_report(snapshots):
+    totals = {key: sum(snap.get(key, 0) for snap in snapshots) for key in _waits}
+    totals['max_wait_seconds'] = max((snap.get('max_wait_seconds', 0.0) for snap in snapshots), default=0.0)
+    if totals['acquisitions']:
+        print(f"pyautogui lock: {totals['acquisitions']} acquisitions ({totals['isolated']} on per-display locks), "
+              f"{totals['wait_seconds']:.1f}s waiting, longest wait {totals['max_wait_seconds']:.1f}s")
+    return totals
+
+
+register_worker_stats('gui_lock', snapshot, print_lock_report, reset)